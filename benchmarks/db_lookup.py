@@ -0,0 +1,110 @@
+"""
+Задержка проверки прав в зависимости от размера таблицы прав.
+
+Скрипт пересоздаёт таблицы в отдельной базе, заполняет accesses через
+generate_series, переносит строки в effective_accesses (групп нет,
+эффективные права совпадают с прямыми) и замеряет DBManager.access_get
+с индексами effective_accesses и без них.
+База должна быть отдельной (в имени должно быть слово bench):
+
+    POSTGRES_DB=security_bench PYTHONPATH=src python benchmarks/db_lookup.py
+"""
+import argparse
+import asyncio
+import random
+from statistics import quantiles
+from time import perf_counter
+
+from sqlalchemy import text
+
+from security.api.config import DB_CONNECTION_STR
+from security.db import schema
+from security.db.manager import DBManager
+
+PROJECTS_PER_USER = 20
+# access_get читает только effective_accesses
+INDEXES = list(schema.EffectiveAccess.__table__.indexes)
+
+
+async def seed(db: DBManager, rows: int) -> tuple:
+    users = max(1, rows // PROJECTS_PER_USER)
+    projects = max(PROJECTS_PER_USER, rows // 100)
+    async with db.engine.begin() as conn:
+        await conn.run_sync(schema.Base.metadata.drop_all)
+        await conn.run_sync(schema.Base.metadata.create_all)
+        await conn.execute(text(
+            "INSERT INTO users (yoauth_uid, is_admin) "
+            "SELECT 'u' || g, false FROM generate_series(1, :users) g"
+        ), {'users': users})
+        await conn.execute(text(
+            "INSERT INTO projects (name) "
+            "SELECT 'p' || g FROM generate_series(1, :projects) g"
+        ), {'projects': projects})
+        await conn.execute(text(
+            'INSERT INTO accesses (user_id, project_id, read, write, "grant") '
+            'SELECT (g - 1) / :ppu + 1, '
+            '((((g - 1) / :ppu + 1) * 31 + (g - 1) % :ppu) % :projects) + 1, '
+            'true, g % 2 = 0, g % 3 = 0 '
+            'FROM generate_series(1, :rows) g'
+        ), {'ppu': PROJECTS_PER_USER, 'projects': projects, 'rows': rows})
+        await conn.execute(text(
+            'INSERT INTO effective_accesses '
+            '(user_id, project_id, read, write, "grant") '
+            'SELECT user_id, project_id, read, write, "grant" FROM accesses'
+        ))
+        await conn.execute(text('ANALYZE'))
+    return users, projects
+
+
+async def set_indexes(db: DBManager, enabled: bool) -> None:
+    async with db.engine.begin() as conn:
+        for index in INDEXES:
+            if enabled:
+                await conn.run_sync(index.create, checkfirst=True)
+            else:
+                await conn.run_sync(index.drop, checkfirst=True)
+        await conn.execute(text('ANALYZE effective_accesses'))
+
+
+async def measure(db: DBManager, users: int, projects: int,
+                  lookups: int) -> list:
+    timings = []
+    for _ in range(lookups):
+        user_id = random.randint(1, users)
+        project_name = f'p{random.randint(1, projects)}'
+        started = perf_counter()
+        await db.access_get(user_id=user_id, project_name=project_name)
+        timings.append((perf_counter() - started) * 1000)
+    return timings
+
+
+def report(rows: int, indexed: bool, timings: list) -> None:
+    p50, p95, p99 = (quantiles(timings, n=100)[i] for i in (49, 94, 98))
+    print(f'{rows:>9} rows  indexes={"on " if indexed else "off"}  '
+          f'p50={p50:7.3f} ms  p95={p95:7.3f} ms  p99={p99:7.3f} ms')
+
+
+async def main(sizes: list, lookups: int) -> None:
+    if 'bench' not in DB_CONNECTION_STR.rsplit('/', 1)[-1]:
+        raise SystemExit('POSTGRES_DB must point to a scratch *bench* '
+                         'database, tables there are dropped')
+
+    db = DBManager()
+    for rows in sizes:
+        users, projects = await seed(db, rows)
+        for indexed in (False, True):
+            await set_indexes(db, indexed)
+            # прогрев пула соединений и кэша страниц
+            await measure(db, users, projects, 50)
+            report(rows, indexed,
+                   await measure(db, users, projects, lookups))
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.lookups))
@@ -0,0 +1,59 @@
+"""
+Заглушка identity provider для нагрузочных тестов.
+
+Отвечает на GET /info так же, как login.yandex.ru: токен вида tok-<id>
+считается действительным и возвращает {"id": "<id>"}, любой другой
+токен отклоняется с 401. Задержка ответа настраивается, чтобы
+имитировать сеть до настоящего провайдера:
+
+    python benchmarks/identity_stub.py --port 8081 --delay-ms 20
+    IDENTITY_URL=http://127.0.0.1:8081 python -m security.api
+"""
+import argparse
+import asyncio
+from http import HTTPStatus
+
+from aiohttp import web
+
+TOKEN_PREFIX = 'tok-'
+
+
+def token_for(user_number: int) -> str:
+    return f'{TOKEN_PREFIX}{user_number}'
+
+
+def create_stub(delay_ms: float = 0.0) -> web.Application:
+    async def info(request: web.Request) -> web.Response:
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        token = request.headers.get('Authorization', '') \
+            .replace('OAuth ', '', 1)
+        if not token.startswith(TOKEN_PREFIX):
+            return web.json_response({'error': 'invalid-token'},
+                                     status=HTTPStatus.UNAUTHORIZED)
+        return web.json_response({'id': token[len(TOKEN_PREFIX):],
+                                  'login': token})
+
+    app = web.Application()
+    app.router.add_get('/info', info)
+    return app
+
+
+async def start_stub(host: str = '127.0.0.1', port: int = 0,
+                     delay_ms: float = 0.0) -> tuple:
+    """Запускает заглушку в текущем event loop, возвращает (runner, url)."""
+    runner = web.AppRunner(create_stub(delay_ms), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--delay-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(create_stub(args.delay_ms), host=args.host, port=args.port)
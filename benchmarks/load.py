@@ -0,0 +1,231 @@
+"""
+Нагрузочный тест сервиса с локальной заглушкой identity provider.
+
+Поднимает create_app() и заглушку /info в одном процессе, прогоняет
+трафик по фазам (регистрация, создание проектов, выдача прав, чтение)
+и печатает пропускную способность и p50/p95/p99 по каждому endpoint.
+Результат сохраняется в JSON, с которым можно сравнить следующий прогон.
+
+Таблицы в базе пересоздаются, поэтому база должна быть отдельной:
+
+    POSTGRES_DB=security_bench PYTHONPATH=src python benchmarks/load.py \\
+        --output results.json --compare previous.json
+
+Вместо синтетического трафика можно воспроизвести JSONL-файл (--replay),
+строка которого: {"phase", "endpoint", "method", "path", "token", "body"}.
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import defaultdict, namedtuple
+from statistics import quantiles
+from time import perf_counter
+
+from aiohttp import ClientSession, TCPConnector, web
+
+from identity_stub import start_stub, token_for
+from security.api.app import create_app, init_db
+from security.api.config import DB_CONNECTION_STR
+from security.api.identity import IdentityClient
+
+Call = namedtuple('Call', 'endpoint method path token body')
+
+
+def synthetic(users: int, projects: int, grants: int, reads: int,
+              seed: int = 0) -> list:
+    """Фазы синтетического трафика: [(имя фазы, [Call, ...]), ...]."""
+    rnd = random.Random(seed)
+    owners = {f'proj-{i}': i % users for i in range(projects)}
+    names = list(owners)
+
+    register = [Call('POST /user', 'POST',
+                     '/user?role=admin' if i == 0 else '/user',
+                     None, {'token': token_for(i)})
+                for i in range(users)]
+
+    create = [Call('POST /project', 'POST', '/project',
+                   token_for(owner), {'name': name})
+              for name, owner in owners.items()]
+
+    # кто может читать проект: владелец и получившие права; чтение
+    # идёт только от них, чтобы любой ответ 4xx означал сбой
+    members = {name: [owner] for name, owner in owners.items()}
+    grant = []
+    for _ in range(grants):
+        name = rnd.choice(names)
+        target = rnd.randrange(1, users)
+        members[name].append(target)
+        write = 'true' if rnd.random() < 0.3 else 'false'
+        grant.append(Call(
+            'PATCH /project/{project_name}', 'PATCH',
+            f'/project/{name}?read=true&write={write}',
+            token_for(owners[name]),
+            {'target_token': token_for(target)}
+        ))
+
+    read = []
+    for _ in range(reads):
+        roll = rnd.random()
+        user = rnd.randrange(users)
+        if roll < 0.7:
+            name = rnd.choice(names)
+            read.append(Call('GET /project/{project_name}', 'GET',
+                             f'/project/{name}',
+                             token_for(rnd.choice(members[name])), None))
+        elif roll < 0.9:
+            read.append(Call('GET /project', 'GET', '/project?limit=100',
+                             token_for(user), None))
+        else:
+            read.append(Call('GET /ping', 'GET', '/ping', None, None))
+
+    return [('register', register), ('create', create), ('grant', grant),
+            ('read', read)]
+
+
+def replay(path: str) -> list:
+    phases = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            method = record.get('method', 'GET').upper()
+            endpoint = record.get(
+                'endpoint',
+                f"{method} {record['path'].split('?', 1)[0]}")
+            phases.setdefault(record.get('phase', 'replay'), []).append(
+                Call(endpoint, method, record['path'], record.get('token'),
+                     record.get('body')))
+    return list(phases.items())
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.wall = defaultdict(float)
+
+    def report(self) -> dict:
+        result = {}
+        for endpoint, timings in sorted(self.latencies.items()):
+            if len(timings) > 1:
+                cuts = quantiles(timings, n=100)
+                p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+            else:
+                p50 = p95 = p99 = timings[0]
+            result[endpoint] = {
+                'count': len(timings),
+                'errors': self.errors[endpoint],
+                'statuses': dict(self.statuses[endpoint]),
+                'rps': round(len(timings) / self.wall[endpoint], 1),
+                'p50_ms': round(p50, 3),
+                'p95_ms': round(p95, 3),
+                'p99_ms': round(p99, 3),
+            }
+        return result
+
+
+async def run_phase(session: ClientSession, base_url: str, calls: list,
+                    concurrency: int, stats: Stats) -> float:
+    queue = iter(calls)
+
+    async def worker():
+        for call in queue:
+            headers = {'Authorization': call.token} if call.token else {}
+            started = perf_counter()
+            try:
+                async with session.request(call.method, base_url + call.path,
+                                           json=call.body,
+                                           headers=headers) as resp:
+                    await resp.read()
+                    status = resp.status
+            except Exception:
+                status = 'exception'
+            stats.latencies[call.endpoint].append(
+                (perf_counter() - started) * 1000)
+            stats.statuses[call.endpoint][str(status)] += 1
+            # 4xx тоже сбой: например, 429 при регистрации оставил бы
+            # следующие фазы без части пользователей
+            if status == 'exception' or status >= 400:
+                stats.errors[call.endpoint] += 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = perf_counter() - started
+    for endpoint in {call.endpoint for call in calls}:
+        stats.wall[endpoint] += wall
+    return wall
+
+
+def print_report(report: dict, previous: dict = None) -> None:
+    for endpoint, row in report.items():
+        line = f"{endpoint:<32} n={row['count']:<6} " \
+               f"err={row['errors']:<4} {row['rps']:>8.1f} rps  " \
+               f"p50={row['p50_ms']:8.2f}  p95={row['p95_ms']:8.2f}  " \
+               f"p99={row['p99_ms']:8.2f} ms"
+        old = (previous or {}).get(endpoint)
+        if old:
+            line += f"  (p95 {row['p95_ms'] - old['p95_ms']:+.2f} ms, " \
+                    f"rps {row['rps'] - old['rps']:+.1f})"
+        print(line)
+
+
+async def main(args) -> None:
+    if 'bench' not in DB_CONNECTION_STR.rsplit('/', 1)[-1]:
+        raise SystemExit('POSTGRES_DB must point to a scratch *bench* '
+                         'database, tables there are dropped')
+    await init_db()
+
+    phases = replay(args.replay) if args.replay else synthetic(
+        args.users, args.projects, args.grants, args.reads, args.seed)
+
+    stub_runner, stub_url = await start_stub(delay_ms=args.identity_delay_ms)
+    app = create_app()
+    app['identity_client'] = IdentityClient(base_url=stub_url)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base_url = f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+    stats = Stats()
+    try:
+        async with ClientSession(
+                connector=TCPConnector(limit=args.concurrency)) as session:
+            for name, calls in phases:
+                wall = await run_phase(session, base_url, calls,
+                                       args.concurrency, stats)
+                print(f'phase {name}: {len(calls)} requests '
+                      f'in {wall:.2f} s')
+    finally:
+        await runner.cleanup()
+        await stub_runner.cleanup()
+
+    report = stats.report()
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = json.load(file)['endpoints']
+    print_report(report, previous)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'args': vars(args), 'endpoints': report}, file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--grants', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--identity-delay-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='JSONL file with recorded traffic')
+    parser.add_argument('--output', help='where to save JSON results')
+    parser.add_argument('--compare', help='previous JSON results')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""
+Накладные расходы sqlalchemy на вызов запроса DBManager.
+
+Сравнивает построение запроса на каждый вызов (как было раньше) с
+переиспользованием готовых запросов из security.db.queries. Запросы
+выполняются на sqlite в памяти, чтобы в замер попадала почти только
+работа sqlalchemy, а не сеть и Postgres:
+
+    PYTHONPATH=src python benchmarks/statement_cache.py
+"""
+import argparse
+from time import perf_counter
+
+from sqlalchemy import create_engine, select, and_, insert, text
+
+from security.db import queries
+from security.db.schema import Project, User, UserAccess, EffectiveAccess
+
+# версии effective_accesses берутся из последовательности Postgres,
+# которой в sqlite нет, поэтому таблица создаётся упрощённой
+EFFECTIVE_ACCESSES_DDL = text('''
+CREATE TABLE effective_accesses (
+    id INTEGER PRIMARY KEY,
+    read BOOLEAN NOT NULL,
+    write BOOLEAN NOT NULL,
+    "grant" BOOLEAN NOT NULL,
+    version BIGINT NOT NULL DEFAULT 1,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    project_id INTEGER NOT NULL REFERENCES projects (id),
+    UNIQUE (user_id, project_id)
+)
+''')
+
+
+def build_principal(yandex_id):
+    return select(User.id, User.is_admin) \
+        .where(User.yoauth_uid == yandex_id)
+
+
+def build_access_get(user_id, project_name):
+    return select(User.id.label('user_id'), User.is_admin,
+                  Project.id.label('project_id'),
+                  Project.name.label('project_name'),
+                  EffectiveAccess.read, EffectiveAccess.write,
+                  EffectiveAccess.grant,
+                  Project.version.label('project_version'),
+                  EffectiveAccess.version.label('access_version')) \
+        .select_from(User) \
+        .outerjoin(Project, Project.name == project_name) \
+        .outerjoin(EffectiveAccess,
+                   and_(EffectiveAccess.user_id == User.id,
+                        EffectiveAccess.project_id == Project.id)) \
+        .where(User.id == user_id) \
+        .limit(1)
+
+
+CASES = {
+    'user_get_principal': (
+        lambda conn, i: conn.execute(build_principal(f'u{i % 100}')),
+        lambda conn, i: conn.execute(queries.USER_GET_PRINCIPAL,
+                                     {'yandex_id': f'u{i % 100}'}),
+    ),
+    'access_get': (
+        lambda conn, i: conn.execute(
+            build_access_get(i % 100 + 1, f'p{i % 10}')),
+        lambda conn, i: conn.execute(
+            queries.ACCESS_GET_BY_USER_ID,
+            {'user_id': i % 100 + 1, 'project_name': f'p{i % 10}'}),
+    ),
+}
+
+
+def seed(conn) -> None:
+    for table in (User, Project, UserAccess):
+        table.__table__.create(conn)
+    conn.execute(EFFECTIVE_ACCESSES_DDL)
+    conn.execute(insert(User), [{'yoauth_uid': f'u{i}', 'is_admin': False}
+                                for i in range(100)])
+    conn.execute(insert(Project), [{'name': f'p{i}'} for i in range(10)])
+    rights = [{'user_id': i + 1, 'project_id': i % 10 + 1,
+               'read': True, 'write': True, 'grant': False}
+              for i in range(100)]
+    conn.execute(insert(UserAccess), rights)
+    # групп нет, эффективные права совпадают с прямыми
+    conn.execute(insert(EffectiveAccess), rights)
+
+
+def run(conn, call, calls: int) -> float:
+    for i in range(min(calls, 1000)):
+        call(conn, i).fetchone()
+    started = perf_counter()
+    for i in range(calls):
+        call(conn, i).fetchone()
+    return (perf_counter() - started) / calls * 1_000_000
+
+
+def main(calls: int) -> None:
+    engine = create_engine('sqlite://', future=True)
+    with engine.connect() as conn:
+        seed(conn)
+        for name, (before, after) in CASES.items():
+            built = run(conn, before, calls)
+            cached = run(conn, after, calls)
+            print(f'{name:<20} built per call {built:7.1f} us  '
+                  f'precompiled {cached:7.1f} us  '
+                  f'({built / cached:.2f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--calls', type=int, default=20000)
+    main(parser.parse_args().calls)
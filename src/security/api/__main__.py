@@ -1,15 +1,196 @@
-from aiohttp.web import run_app
-from security.api.app import create_app
+"""
+Запуск сервиса.
 
+При SERVICE_WORKERS=1 сервис работает в текущем процессе. При большем
+числе запускаются рабочие процессы, каждый со своим приложением, пулом
+соединений к БД и клиентом identity provider. Процессы слушают один
+порт через SO_REUSEPORT или, при SERVICE_REUSE_PORT=false, общий сокет,
+открытый до fork. Упавший процесс перезапускается.
 
-def main():
-    app = create_app()
+По SIGTERM/SIGINT процессы перестают принимать соединения, дожидаются
+запросов в обработке (не дольше SERVICE_SHUTDOWN_TIMEOUT) и закрывают
+ресурсы приложения. Каждый процесс пишет свой лог: api_logs.1.txt, ...
+
+Метрики не агрегируются между процессами: /metrics на общем порту
+отдаёт метрики того процесса, которому досталось соединение. Для
+prefork задаётся SERVICE_METRICS_PORT, и процесс N отдаёт свои метрики
+на порту SERVICE_METRICS_PORT + N - 1; Prometheus опрашивает каждый
+из этих портов, а суммирует запросом (sum by ...).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Optional
+
+from aiohttp.web import AppRunner, SockSite, TCPSite
+
+from security.api.app import create_app, create_metrics_app
+from security.api.config import SERVICE_HOST, SERVICE_PORT, \
+    SERVICE_WORKERS, SERVICE_REUSE_PORT, SERVICE_UVLOOP, SERVICE_BACKLOG, \
+    SERVICE_KEEPALIVE_TIMEOUT, SERVICE_ACCESS_LOG, SERVICE_SHUTDOWN_TIMEOUT, \
+    SERVICE_METRICS_PORT, LOG_FILE
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    if SERVICE_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            logging.getLogger('messenger-api').warning(
+                'SERVICE_UVLOOP is set, but uvloop is not installed')
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def worker_log_file(worker: Optional[int]) -> str:
+    if worker is None:
+        return LOG_FILE
+    path = Path(LOG_FILE)
+    return str(path.with_name(f'{path.stem}.{worker}{path.suffix}'))
 
-    run_app(
+
+def metrics_port(worker: Optional[int]) -> Optional[int]:
+    if not SERVICE_METRICS_PORT:
+        return None
+    return SERVICE_METRICS_PORT + (worker or 1) - 1
+
+
+def listen_socket() -> socket.socket:
+    """Сокет для prefork: открывается один раз и наследуется процессами."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((SERVICE_HOST, int(SERVICE_PORT)))
+    sock.listen(SERVICE_BACKLOG)
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def serve(worker: Optional[int] = None,
+                sock: Optional[socket.socket] = None) -> None:
+    app = create_app(log_file=worker_log_file(worker))
+    runner = AppRunner(
         app,
-        host=app['service_host'],
-        port=app['service_port'],
+        access_log=logging.getLogger('aiohttp.access')
+        if SERVICE_ACCESS_LOG else None,
+        keepalive_timeout=SERVICE_KEEPALIVE_TIMEOUT,
+        shutdown_timeout=SERVICE_SHUTDOWN_TIMEOUT,
     )
+    await runner.setup()
+
+    if sock is not None:
+        site = SockSite(runner, sock, backlog=SERVICE_BACKLOG)
+    else:
+        site = TCPSite(runner, app['service_host'], int(app['service_port']),
+                       backlog=SERVICE_BACKLOG,
+                       reuse_port=worker is not None and SERVICE_REUSE_PORT)
+
+    metrics_runner = None
+    if metrics_port(worker) is not None:
+        metrics_runner = AppRunner(create_metrics_app(app), access_log=None)
+        await metrics_runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    try:
+        await site.start()
+        if metrics_runner is not None:
+            await TCPSite(metrics_runner, SERVICE_HOST,
+                          metrics_port(worker)).start()
+        if worker is None:
+            print(f'======== Running on {site.name} ========')
+        await stop.wait()
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # cleanup закрывает сокеты, ждёт активные запросы и вызывает
+        # on_shutdown/on_cleanup приложения
+        await runner.cleanup()
+
+
+def run_worker(worker: Optional[int] = None,
+               sock: Optional[socket.socket] = None) -> None:
+    # обработчики сигналов супервизора достались от fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    loop = new_event_loop()
+    try:
+        loop.run_until_complete(serve(worker, sock))
+    finally:
+        loop.close()
+
+
+class Supervisor:
+    """Запускает рабочие процессы и перезапускает упавшие."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.stopping = False
+        self.sock = None if SERVICE_REUSE_PORT else listen_socket()
+
+    def spawn(self, worker: int) -> None:
+        process = self.context.Process(
+            target=run_worker, args=(worker, self.sock),
+            name=f'security-api-{worker}', daemon=False)
+        process.start()
+        self.processes[worker] = process
+
+    def stop(self, *_) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker in range(1, self.workers + 1):
+            self.spawn(worker)
+        print(f'======== Running on http://{SERVICE_HOST}:{SERVICE_PORT} '
+              f'with {self.workers} workers ========')
+
+        while not self.stopping:
+            wait([process.sentinel
+                  for process in self.processes.values()], timeout=1)
+            for worker, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping:
+                    logging.getLogger('messenger-api').error(
+                        'worker %s exited with code %s, restarting',
+                        worker, process.exitcode)
+                    # не перезапускаем в цикле, если процесс падает сразу
+                    time.sleep(1)
+                    self.spawn(worker)
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        for process in self.processes.values():
+            process.join(SERVICE_SHUTDOWN_TIMEOUT + 5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if self.sock is not None:
+            self.sock.close()
+
+
+def main():
+    workers = SERVICE_WORKERS or os.cpu_count() or 1
+    if workers == 1:
+        run_worker()
+    else:
+        Supervisor(workers).run()
 
 
 if __name__ == '__main__':
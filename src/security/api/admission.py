@@ -0,0 +1,140 @@
+"""
+Контроль допуска запросов при перегрузке.
+
+Одновременно обрабатывается не больше max_in_flight запросов, от одного
+клиента (по заголовку Authorization) - не больше max_per_user. Запросы
+без Authorization (регистрация) ограничиваются только общим лимитом:
+по адресу клиента их не различить, за NAT он общий у многих. Лишние
+запросы ждут в очереди не дольше queue_timeout, после чего получают 503.
+Обычные запросы обслуживаются из очереди раньше тяжёлых. Служебные
+запросы (/ping, /ping_db, /metrics) не ограничиваются.
+
+Когда среднее ожидание соединения из пула БД превышает pool_wait_limit,
+тяжёлые запросы отклоняются сразу, а обычные - вместо постановки
+в очередь: ждать всё равно пришлось бы дольше разумного.
+"""
+import asyncio
+import heapq
+import itertools
+from collections import defaultdict
+from typing import Callable, Optional
+
+from aiohttp.web import Request
+
+from security.api.errors import ClientError, TooManyRequests, \
+    ServiceOverloaded
+from security.api.metrics import ADMISSION_QUEUED, ADMISSION_REJECTED
+
+CRITICAL, NORMAL, HEAVY = 0, 1, 2
+
+CRITICAL_PATHS = frozenset(('/ping', '/ping_db', '/metrics'))
+HEAVY_METHODS = frozenset(('PATCH',))
+
+
+def request_priority(request: Request) -> int:
+    if request.path in CRITICAL_PATHS:
+        return CRITICAL
+    if request.method in HEAVY_METHODS:
+        return HEAVY
+    return NORMAL
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_per_user: int,
+                 queue_size: int, queue_timeout: float,
+                 pool_wait_limit: float,
+                 pool_wait: Callable[[], float] = lambda: 0.0):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.pool_wait_limit = pool_wait_limit
+        self.pool_wait = pool_wait
+        self.in_flight = 0
+        self.queued = 0
+        self._per_user = defaultdict(int)
+        # (приоритет, порядковый номер, future); отменённые ожидания
+        # остаются в куче и пропускаются при выдаче слота
+        self._waiters = []
+        self._order = itertools.count()
+
+    def _reject(self, reason: str, error: ClientError) -> ClientError:
+        ADMISSION_REJECTED.labels(reason).inc()
+        return error
+
+    async def acquire(self, user_key: Optional[str],
+                      priority: int) -> Optional[ClientError]:
+        """Занимает слот или возвращает ошибку, которой надо ответить.
+        После успешного acquire обязателен release. user_key None -
+        клиент неизвестен, лимит на клиента не применяется."""
+        if user_key is not None and \
+                self._per_user.get(user_key, 0) >= self.max_per_user:
+            return self._reject('per-user', TooManyRequests)
+
+        overloaded = self.pool_wait() > self.pool_wait_limit
+        if overloaded and priority == HEAVY:
+            return self._reject('pool-wait', ServiceOverloaded)
+
+        if user_key is not None:
+            self._per_user[user_key] += 1
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            return None
+
+        error = None
+        try:
+            if overloaded:
+                error = self._reject('pool-wait', ServiceOverloaded)
+            elif self.queued >= self.queue_size:
+                error = self._reject('queue-full', ServiceOverloaded)
+            elif not await self._wait(priority):
+                error = self._reject('queue-timeout', ServiceOverloaded)
+        except asyncio.CancelledError:
+            self._release_user(user_key)
+            raise
+
+        if error is not None:
+            self._release_user(user_key)
+        return error
+
+    async def _wait(self, priority: int) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        ADMISSION_QUEUED.set(self.queued)
+        try:
+            await asyncio.wait((future,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if future.done():
+                # слот уже передан, но запрос отменён - отдаём дальше
+                self._hand_over()
+            raise
+        finally:
+            if not future.done():
+                # слот не выдан: истёк срок или запрос отменён
+                future.cancel()
+                self.queued -= 1
+                ADMISSION_QUEUED.set(self.queued)
+        return not future.cancelled()
+
+    def release(self, user_key: Optional[str]) -> None:
+        self._release_user(user_key)
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # слот передаётся ожидающему, in_flight не меняется
+                self.queued -= 1
+                ADMISSION_QUEUED.set(self.queued)
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _release_user(self, user_key: Optional[str]) -> None:
+        if user_key is None:
+            return
+        self._per_user[user_key] -= 1
+        if not self._per_user[user_key]:
+            del self._per_user[user_key]
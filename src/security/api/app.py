@@ -1,16 +1,28 @@
 import asyncio
+from pathlib import Path
 from aiohttp.web import Application
+from alembic.command import upgrade
+from alembic.config import Config
+from security.api.admission import AdmissionController
+from security.api.cache import PrincipalCache, SingleFlight
 from security.api.config import DB_CONNECTION_STR, SERVICE_HOST, \
-    SERVICE_PORT
+    SERVICE_PORT, PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_NEGATIVE_TTL, \
+    PRINCIPAL_CACHE_SIZE, LOG_FILE, SERVICE_WARM_UP_TIMEOUT, \
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_PER_USER, ADMISSION_QUEUE_SIZE, \
+    ADMISSION_QUEUE_TIMEOUT, ADMISSION_POOL_WAIT_LIMIT
 from security.db.manager import DBManager
-from security.api.handlers import HANDLERS
+from security.db.matrix import AccessMatrix
+from security.api.handlers import HANDLERS, MetricsView
+from security.api.identity import IdentityClient
 from security.api.log import LogManager
-from security.api.middlewares import authorization, error_solving
+from security.api.middlewares import metrics, tracing, admission, \
+    db_session, authorization, error_solving
 from security.db import schema
 from sqlalchemy.ext.asyncio import create_async_engine
 
 
 async def init_db(conn_string: str = DB_CONNECTION_STR):
+    """Пересоздаёт все таблицы с нуля, только для разработки."""
     app_engine = create_async_engine(conn_string)
     async with app_engine.begin() as conn:
         await conn.run_sync(schema.Base.metadata.drop_all)
@@ -22,17 +34,132 @@ def setup_routes(app: Application):
         app.router.add_route('*', handler.URL_PATH, handler)
 
 
-def create_app() -> Application:
-    log_manager = LogManager()
+def create_metrics_app(app: Application) -> Application:
+    """
+    Приложение только с /metrics процесса для отдельного порта. Процессы
+    prefork делят основной порт, и /metrics на нём отдаёт метрики
+    случайного процесса, поэтому Prometheus опрашивает каждый процесс
+    на его порту.
+    """
+    metrics_app = Application()
+    metrics_app['pg_db_manager'] = app['pg_db_manager']
+    metrics_app.router.add_route('*', MetricsView.URL_PATH, MetricsView)
+    return metrics_app
+
+
+async def start_identity_client(app: Application):
+    await app['identity_client'].start()
+
+
+async def warm_up(app: Application):
+    """
+    Открывает соединения пула БД и identity provider до приёма запросов:
+    aiohttp начинает слушать порт только после on_startup. Неудачный
+    прогрев не останавливает сервис: /ping_db отвечает 503 и повторяет
+    прогрев пула, пока он не удастся.
+    """
+    results = await asyncio.gather(
+        asyncio.wait_for(app['pg_db_manager'].warm_up(),
+                         SERVICE_WARM_UP_TIMEOUT),
+        asyncio.wait_for(app['identity_client'].warm_up(),
+                         SERVICE_WARM_UP_TIMEOUT),
+        return_exceptions=True
+    )
+    for name, result in zip(('db', 'identity'), results):
+        if isinstance(result, BaseException):
+            app['log_manager'].logger.error(
+                '%s warm-up failed error=%r', name, result)
+
+
+async def dispose_db(app: Application):
+    await app['pg_db_manager'].dispose()
+
+
+async def close_identity_client(app: Application):
+    await app['identity_client'].close()
+
+
+async def start_rights_listener(app: Application):
+    await app['pg_db_manager'].rights_listener.start()
+
+
+def reset_on_rights_change(app: Application):
+    """
+    Матрица доступа меняется только по уведомлениям, в том числе по
+    своим: Postgres доставляет их после фиксации транзакции и в порядке
+    фиксаций, поэтому откаченные изменения в матрицу не попадают.
+    Массовые изменения (импорт) сбрасывают матрицу и кэш токенов.
+    """
+    def handle(message: dict) -> None:
+        matrix = app['access_matrix']
+        if message.get('all'):
+            matrix.clear()
+            app['principal_cache'].clear()
+            return
+        if 'project_name' in message:
+            matrix.add_project(message['project_id'],
+                               message['project_name'])
+        if 'changes' in message:
+            if message['changes'] is None:
+                # изменения не поместились в уведомление
+                matrix.invalidate()
+            else:
+                matrix.apply_changes(message['changes'])
+    return handle
+
+
+async def stop_rights_listener(app: Application):
+    await app['pg_db_manager'].rights_listener.stop()
+
+
+async def stop_log_manager(app: Application):
+    app['log_manager'].stop()
+
+
+def create_app(log_file: str = LOG_FILE) -> Application:
+    log_manager = LogManager(log_file)
     logger = log_manager.logger
 
     app = Application(
-        middlewares=[authorization, error_solving, ],
+        # error_solving снаружи db_session: иначе исключение обработчика
+        # превращается в ответ раньше, чем его увидит транзакция, и
+        # записи фиксируются вместо отката. authorization снаружи
+        # db_session: principal берётся из кэша или из identity provider,
+        # и соединение не должно простаивать в ожидании его ответа
+        middlewares=[metrics, tracing, admission, error_solving,
+                     authorization, db_session, ],
         logger=logger
     )
 
+    # engine и соединения создаются лениво и прогреваются в on_startup
     app['pg_db_manager'] = DBManager()
+    app['admission'] = AdmissionController(
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        max_per_user=ADMISSION_MAX_PER_USER,
+        queue_size=ADMISSION_QUEUE_SIZE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        pool_wait_limit=ADMISSION_POOL_WAIT_LIMIT,
+        pool_wait=app['pg_db_manager'].recent_pool_wait
+    )
     app['log_manager'] = log_manager
+    app['identity_client'] = IdentityClient()
+    app['access_matrix'] = AccessMatrix()
+    app['principal_cache'] = PrincipalCache(
+        ttl=PRINCIPAL_CACHE_TTL,
+        negative_ttl=PRINCIPAL_CACHE_NEGATIVE_TTL,
+        max_size=PRINCIPAL_CACHE_SIZE
+    )
+    app['project_reads'] = SingleFlight('project_get')
+    app['pg_db_manager'].rights_listener.on_message = \
+        reset_on_rights_change(app)
+
+    app.on_startup.append(start_identity_client)
+    app.on_startup.append(start_rights_listener)
+    app.on_startup.append(warm_up)
+    app.on_cleanup.append(close_identity_client)
+    app.on_cleanup.append(stop_rights_listener)
+    app.on_cleanup.append(dispose_db)
+    app.on_cleanup.append(stop_log_manager)
 
     # run_migrations()
 
@@ -45,4 +172,7 @@ def create_app() -> Application:
 
 
 def run_migrations():
-    asyncio.run(init_db())
+    db_path = Path(__file__).parent.parent / 'db'
+    config = Config(str(db_path / 'alembic.ini'))
+    config.set_main_option('script_location', str(db_path / 'alembic'))
+    upgrade(config, 'head')
@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict
+from hashlib import sha256
+from time import monotonic
+from typing import Awaitable, Callable, Hashable, NamedTuple, Optional
+
+from security.api.metrics import SINGLE_FLIGHT_CALLS
+
+
+class Principal(NamedTuple):
+    user_id: int
+    is_admin: bool
+
+
+class SingleFlight:
+    """
+    Одновременные вызовы с одинаковым ключом ждут один общий результат.
+
+    Результат не хранится после завершения вызова, поэтому данные не
+    устаревают: следующий вызов с тем же ключом снова идёт в источник.
+    Если первый вызов отменён, ожидающие выполняют загрузку сами.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+        self._leader_calls = SINGLE_FLIGHT_CALLS.labels(name, 'leader')
+        self._shared_calls = SINGLE_FLIGHT_CALLS.labels(name, 'shared')
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable]):
+        future = self._in_flight.get(key)
+        if future is not None:
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                self._shared_calls.inc()
+                return future.result()
+            return await self.do(key, loader)
+
+        self._leader_calls.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # исключение уже передано ожидающим, самому future оно не нужно
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+
+class PrincipalCache:
+    """
+    Кэш результатов проверки токенов: sha256(token) -> Principal.
+
+    Записи живут ttl секунд, при переполнении вытесняются самые давно
+    использованные. Отклонённые токены кэшируются отдельно на
+    negative_ttl секунд. Одновременные запросы с одним и тем же токеном
+    ждут один общий поход в identity provider и БД.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._flight = SingleFlight('principal')
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return sha256(token.encode('utf-8')).digest()
+
+    def _lookup(self, key: bytes):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, principal = entry
+        if expires_at < monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, principal
+
+    def _store(self, key: bytes, principal: Optional[Principal]) -> None:
+        ttl = self.ttl if principal is not None else self.negative_ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[key] = (monotonic() + ttl, principal)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, token: str,
+                  loader: Callable[[], Awaitable[Optional[Principal]]]
+                  ) -> Optional[Principal]:
+        key = self.key(token)
+        found, principal = self._lookup(key)
+        if found:
+            return principal
+
+        async def load():
+            principal = await loader()
+            self._store(key, principal)
+            return principal
+
+        return await self._flight.do(key, load)
+
+    def invalidate(self, token: str) -> None:
+        self._entries.pop(self.key(token), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -9,3 +9,75 @@ DB_CONNECTION_STR = f"postgresql+asyncpg://" \
                     f"{environ.get('POSTGRES_DB', 'security')}"
 SERVICE_HOST = environ.get('SERVICE_HOST', '0.0.0.0')
 SERVICE_PORT = environ.get('SERVICE_PORT', '8080')
+
+# 0 - по числу ядер; больше одного - несколько процессов на одном порту
+SERVICE_WORKERS = int(environ.get('SERVICE_WORKERS', '1'))
+# SO_REUSEPORT, иначе prefork с общим сокетом, открытым до fork
+SERVICE_REUSE_PORT = environ.get('SERVICE_REUSE_PORT', 'true') == 'true'
+# метрики хранятся в памяти процесса: процесс N отдаёт свой /metrics
+# на SERVICE_METRICS_PORT + N - 1, 0 - отдельные порты не открываются
+SERVICE_METRICS_PORT = int(environ.get('SERVICE_METRICS_PORT', '0'))
+SERVICE_UVLOOP = environ.get('SERVICE_UVLOOP', '') == 'true'
+SERVICE_BACKLOG = int(environ.get('SERVICE_BACKLOG', '1024'))
+SERVICE_KEEPALIVE_TIMEOUT = float(
+    environ.get('SERVICE_KEEPALIVE_TIMEOUT', '75'))
+SERVICE_ACCESS_LOG = environ.get('SERVICE_ACCESS_LOG', '') == 'true'
+SERVICE_SHUTDOWN_TIMEOUT = float(
+    environ.get('SERVICE_SHUTDOWN_TIMEOUT', '30'))
+# ограничение одновременных запросов и очередь перед ними
+ADMISSION_MAX_IN_FLIGHT = int(environ.get('ADMISSION_MAX_IN_FLIGHT', '200'))
+ADMISSION_MAX_PER_USER = int(environ.get('ADMISSION_MAX_PER_USER', '20'))
+ADMISSION_QUEUE_SIZE = int(environ.get('ADMISSION_QUEUE_SIZE', '500'))
+ADMISSION_QUEUE_TIMEOUT = float(
+    environ.get('ADMISSION_QUEUE_TIMEOUT', '1'))
+# при таком среднем ожидании соединения из пула тяжёлые запросы
+# отклоняются сразу, а остальные не ставятся в очередь
+ADMISSION_POOL_WAIT_LIMIT = float(
+    environ.get('ADMISSION_POOL_WAIT_LIMIT', '0.5'))
+# сколько ждать прогрева БД и identity provider перед приёмом запросов
+SERVICE_WARM_UP_TIMEOUT = float(
+    environ.get('SERVICE_WARM_UP_TIMEOUT', '10'))
+
+PRINCIPAL_CACHE_TTL = float(environ.get('PRINCIPAL_CACHE_TTL', '60'))
+PRINCIPAL_CACHE_NEGATIVE_TTL = float(
+    environ.get('PRINCIPAL_CACHE_NEGATIVE_TTL', '5'))
+PRINCIPAL_CACHE_SIZE = int(environ.get('PRINCIPAL_CACHE_SIZE', '10000'))
+
+IDENTITY_URL = environ.get('IDENTITY_URL', 'https://login.yandex.ru')
+IDENTITY_POOL_LIMIT = int(environ.get('IDENTITY_POOL_LIMIT', '100'))
+IDENTITY_CONNECT_TIMEOUT = float(environ.get('IDENTITY_CONNECT_TIMEOUT', '2'))
+IDENTITY_READ_TIMEOUT = float(environ.get('IDENTITY_READ_TIMEOUT', '5'))
+# весь запрос, включая ожидание свободного соединения пула
+IDENTITY_TOTAL_TIMEOUT = float(environ.get('IDENTITY_TOTAL_TIMEOUT', '8'))
+IDENTITY_VERIFY_SSL = environ.get('IDENTITY_VERIFY_SSL', '') == 'true'
+# соединения с identity provider, открываемые при старте
+IDENTITY_WARM_UP = int(environ.get('IDENTITY_WARM_UP', '2'))
+
+DB_POOL_SIZE = int(environ.get('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(environ.get('DB_POOL_RECYCLE', '1800'))
+# проверка соединения при выдаче из пула - лишнее обращение к Postgres
+# на каждый запрос; включать, если соединения рвутся между запросами
+DB_POOL_PRE_PING = environ.get('DB_POOL_PRE_PING', 'false') == 'true'
+# соединения пула, открываемые при старте, до приёма запросов
+DB_POOL_WARM_UP = int(environ.get('DB_POOL_WARM_UP', '5'))
+DB_READY_TIMEOUT = float(environ.get('DB_READY_TIMEOUT', '2'))
+DB_QUERY_CACHE_SIZE = int(environ.get('DB_QUERY_CACHE_SIZE', '500'))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    environ.get('DB_PREPARED_STATEMENT_CACHE_SIZE', '500'))
+
+RIGHTS_CACHE_TTL = float(environ.get('RIGHTS_CACHE_TTL', '30'))
+RIGHTS_CACHE_SIZE = int(environ.get('RIGHTS_CACHE_SIZE', '100000'))
+RIGHTS_CHANNEL = environ.get('RIGHTS_CHANNEL', 'rights_invalidation')
+
+LOG_FILE = environ.get('LOG_FILE', 'api_logs.txt')
+LOG_LEVEL = environ.get('LOG_LEVEL', 'DEBUG').upper()
+# размер файла для ротации; LOG_ROTATE_WHEN (например, midnight)
+# включает ротацию по времени вместо ротации по размеру
+LOG_ROTATE_BYTES = int(environ.get('LOG_ROTATE_BYTES', str(100 * 2 ** 20)))
+LOG_ROTATE_WHEN = environ.get('LOG_ROTATE_WHEN', '')
+LOG_BACKUP_COUNT = int(environ.get('LOG_BACKUP_COUNT', '5'))
+
+# orjson, если установлен, иначе стандартный json
+JSON_BACKEND = environ.get('JSON_BACKEND', 'orjson')
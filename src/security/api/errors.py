@@ -1,15 +1,22 @@
 from http import HTTPStatus
 
-from aiohttp.web import Response, json_response
+from aiohttp.web import Response
 from security.api.models import DefaultErrorResponse
+from security.api.serialization import StaticResponse, json_response
 
 
-class ClientError:
+class ClientError(StaticResponse):
     def __init__(self, status: int, error: str):
+        # тело без info не меняется, поэтому сериализуется один раз
+        super().__init__(
+            DefaultErrorResponse(message=error).dict(exclude_none=True),
+            status)
         self._status = status
         self._error = error
 
     def __call__(self, info: dict = None, *args, **kwargs) -> Response:
+        if info is None:
+            return super().__call__()
         return json_response(
             data=DefaultErrorResponse(message=self._error, info=info).dict(
                 exclude_none=True),
@@ -37,6 +44,11 @@ ProjectNotFound = ClientError(
     'project-not-found'
 )
 
+GroupNotFound = ClientError(
+    HTTPStatus.NOT_FOUND,
+    'group-not-found'
+)
+
 AuthorizationRequired = ClientError(
     HTTPStatus.UNAUTHORIZED,
     'authorization-required'
@@ -77,3 +89,18 @@ UpdateRightsError = ClientError(
     "error-during-update"
 )
 
+
+DatabaseUnavailable = ClientError(
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    "db-is-unavailable"
+)
+
+TooManyRequests = ClientError(
+    HTTPStatus.TOO_MANY_REQUESTS,
+    "too-many-requests"
+)
+
+ServiceOverloaded = ClientError(
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    "service-overloaded"
+)
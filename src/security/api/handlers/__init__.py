@@ -1,10 +1,23 @@
-from .ping import PingView
-from .user import RegisterView
-from .project import ProjectView, ProjectNameView
+from .ping import PingView, PingDBView
+from .user import RegisterView, UserImportView
+from .project import ProjectView, ProjectNameView, ProjectRightsView
+from .group import GroupView, GroupNameView, GroupMembersView, \
+    ProjectGroupView
+from .matrix import MatrixView
+from .metrics import MetricsView
 
 HANDLERS = (
     PingView,
+    PingDBView,
     RegisterView,
+    UserImportView,
     ProjectView,
     ProjectNameView,
+    ProjectRightsView,
+    GroupView,
+    GroupNameView,
+    GroupMembersView,
+    ProjectGroupView,
+    MatrixView,
+    MetricsView,
 )
@@ -5,3 +5,13 @@ class BaseView(View):
     def __init__(self, request: Request):
         # self.base = self.request.app['pg_db_manager']
         super().__init__(request)
+
+    def abort_stream(self, error: Exception) -> None:
+        """
+        Ошибка после отправки заголовков: статус уже ушёл, ответить
+        ошибкой нельзя. Соединение обрывается без завершающего чанка,
+        чтобы клиент не принял неполное тело за целое.
+        """
+        self.request.app['log_manager'].log_error(error)
+        if self.request.transport is not None:
+            self.request.transport.close()
@@ -0,0 +1,154 @@
+from http import HTTPStatus
+from aiohttp.web import Response
+from security.api.handlers.base import BaseView
+from security.api.handlers.project import ProjectAccessView, UPDATE_SUCCESS
+from security.api.tracing import span
+from security.api.models import CreateGroupRequest, CreateGroupResponse, \
+    GroupMembersRequest, GroupMembersResponse, Rights
+from security.api.errors import DuplicateNameError, GroupNotFound, \
+    NotEnoughRights, ProjectNotFound
+from security.api.serialization import json_response, read_json
+
+
+class GroupView(BaseView):
+    """Создание групп пользователей, только для администратора."""
+    URL_PATH = '/group'
+
+    async def post(self) -> Response:
+        if not self.request['is_admin']:
+            return NotEnoughRights()
+
+        with span('validate'):
+            body = await read_json(self.request)
+            group = CreateGroupRequest(**body)
+
+        group_id = await self.request.app['pg_db_manager'].group_create(
+            group.name)
+        if group_id is None:
+            return DuplicateNameError()
+
+        return json_response(
+            CreateGroupResponse(group_id=group_id).dict(),
+            status=HTTPStatus.CREATED)
+
+
+class GroupNameView(BaseView):
+    URL_PATH = '/group/{group_name}'
+
+    async def delete(self) -> Response:
+        if not self.request['is_admin']:
+            return NotEnoughRights()
+
+        db_manager = self.request.app['pg_db_manager']
+        group_id = await db_manager.group_get_id(
+            self.request.match_info['group_name'])
+        if group_id is None:
+            return GroupNotFound()
+
+        await db_manager.group_delete(group_id)
+        return UPDATE_SUCCESS()
+
+
+class GroupMembersView(BaseView):
+    """
+    Состав группы, только для администратора: POST добавляет
+    пользователей, DELETE удаляет. Эффективные права участников
+    пересчитываются в той же транзакции.
+    """
+    URL_PATH = '/group/{group_name}/members'
+
+    async def change_members(self, remove: bool) -> Response:
+        if not self.request['is_admin']:
+            return NotEnoughRights()
+
+        with span('validate'):
+            body = await read_json(self.request)
+            members = GroupMembersRequest(**body)
+
+        db_manager = self.request.app['pg_db_manager']
+        group_id = await db_manager.group_get_id(
+            self.request.match_info['group_name'])
+        if group_id is None:
+            return GroupNotFound()
+
+        change = db_manager.group_remove_members if remove \
+            else db_manager.group_add_members
+        changed, _ = await change(group_id, members.user_ids)
+
+        changed_ids = set(changed)
+        return json_response(
+            GroupMembersResponse(
+                changed=sorted(changed_ids),
+                skipped=sorted(set(members.user_ids) - changed_ids)
+            ).dict(),
+            status=HTTPStatus.OK
+        )
+
+    async def post(self) -> Response:
+        return await self.change_members(remove=False)
+
+    async def delete(self) -> Response:
+        return await self.change_members(remove=True)
+
+
+class ProjectGroupView(ProjectAccessView):
+    """
+    Права группы на проект. Выдавать и отзывать их может пользователь
+    с правом передачи, выдать можно только права, которые есть у него
+    самого - как и при выдаче прав одному пользователю.
+    """
+    URL_PATH = '/project/{project_name}/groups/{group_name}'
+
+    async def get_rights_and_group(self):
+        """(project_id, (grant, write, read), group_id) или ответ
+        с ошибкой."""
+        access = await self.get_access()
+        if access is None or access.project_id is None:
+            return ProjectNotFound()
+
+        rights = self.effective_rights(access)
+        if rights is None:
+            return ProjectNotFound()
+        if not rights[0]:
+            return NotEnoughRights()
+
+        group_id = await self.request.app['pg_db_manager'].group_get_id(
+            self.request.match_info['group_name'])
+        if group_id is None:
+            return GroupNotFound()
+        return access.project_id, rights, group_id
+
+    async def patch(self) -> Response:
+        with span('validate'):
+            new_rights = Rights(**self.request.rel_url.query)
+
+        result = await self.get_rights_and_group()
+        if isinstance(result, Response):
+            return result
+        project_id, (grant, write, read), group_id = result
+
+        if (new_rights.read and not read) or \
+                (new_rights.write and not write) or \
+                (new_rights.grant and not grant):
+            return NotEnoughRights()
+
+        await self.request.app['pg_db_manager'].group_access_set(
+            group_id=group_id,
+            project_id=project_id,
+            read=new_rights.read,
+            write=new_rights.write,
+            grant=new_rights.grant
+        )
+        return UPDATE_SUCCESS()
+
+    async def delete(self) -> Response:
+        result = await self.get_rights_and_group()
+        if isinstance(result, Response):
+            return result
+        project_id, _, group_id = result
+
+        changes = await self.request.app['pg_db_manager'] \
+            .group_access_delete(group_id=group_id, project_id=project_id)
+        if changes is None:
+            return GroupNotFound()
+        return UPDATE_SUCCESS()
@@ -0,0 +1,75 @@
+from http import HTTPStatus
+from aiohttp.web import StreamResponse, Response
+from security.api.handlers.base import BaseView
+from security.api.errors import NotEnoughRights, ProjectNotFound
+from security.api.serialization import dumps
+from security.db.matrix import READ, WRITE, GRANT
+
+# размер порции, отправляемой клиенту за один write
+CHUNK_SIZE = 64 * 1024
+
+
+class MatrixView(BaseView):
+    """
+    Матрица доступа пользователь x проект в формате NDJSON: одна строка
+    на каждую связь пользователя с проектом. Параметры user_id и project
+    ограничивают выдачу одним пользователем или одним проектом.
+    """
+    URL_PATH = '/matrix'
+
+    async def get(self) -> Response:
+        params = self.request.rel_url.query
+        matrix = self.request.app['access_matrix']
+        await matrix.ensure_loaded(self.request.app['pg_db_manager'])
+
+        user_id = int(params['user_id']) if 'user_id' in params else None
+
+        project_id = None
+        if 'project' in params:
+            project_id = matrix.project_id(params['project'])
+            if project_id is None:
+                return ProjectNotFound()
+
+        if not self.request['is_admin']:
+            # без роли администратора доступен только свой срез
+            # и срезы проектов, на которые есть право передачи
+            own_slice = user_id == self.request['user_id']
+            grant_slice = False
+            if project_id is not None and user_id is None:
+                # право проверяется по БД: матрица процесса узнаёт
+                # об изменениях в других процессах с задержкой
+                access = await self.request.app['pg_db_manager'].access_get(
+                    user_id=self.request['user_id'],
+                    project_name=params['project'])
+                grant_slice = access is not None and bool(access.grant)
+            if not own_slice and not grant_slice:
+                return NotEnoughRights()
+
+        response = StreamResponse(
+            status=HTTPStatus.OK,
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(self.request)
+
+        chunk = []
+        size = 0
+        for cell_user_id, cell_project_id, name, cell in matrix.iter_cells(
+                user_id=user_id, project_id=project_id):
+            line = dumps({'user_id': cell_user_id,
+                          'project_id': cell_project_id,
+                          'project': name,
+                          'read': bool(cell & READ),
+                          'write': bool(cell & WRITE),
+                          'grant': bool(cell & GRANT)}) + b'\n'
+            chunk.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                await response.write(b''.join(chunk))
+                chunk.clear()
+                size = 0
+
+        if chunk:
+            await response.write(b''.join(chunk))
+        await response.write_eof()
+        return response
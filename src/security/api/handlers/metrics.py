@@ -0,0 +1,19 @@
+from http import HTTPStatus
+from aiohttp.web import Response
+from .base import BaseView
+from security.api.metrics import REGISTRY, CONTENT_TYPE, DB_POOL
+
+
+class MetricsView(BaseView):
+    URL_PATH = '/metrics'
+
+    async def get(self) -> Response:
+        for state, value in \
+                self.request.app['pg_db_manager'].pool_state().items():
+            DB_POOL.labels(state).set(value)
+
+        return Response(
+            body=REGISTRY.expose().encode('utf-8'),
+            status=HTTPStatus.OK,
+            headers={'Content-Type': CONTENT_TYPE}
+        )
@@ -1,7 +1,13 @@
+import asyncio
 from http import HTTPStatus
-from aiohttp.web import json_response, Response
+from aiohttp.web import Response
 from .base import BaseView
-from security.api.models import AppOnlineResponse
+from security.api.config import DB_READY_TIMEOUT
+from security.api.errors import DatabaseUnavailable
+from security.api.models import AppOnlineResponse, DBOnlineResponse
+from security.api.serialization import StaticResponse, json_response
+
+APP_ONLINE = StaticResponse(AppOnlineResponse().dict(), HTTPStatus.OK)
 
 
 class PingView(BaseView):
@@ -9,4 +15,31 @@ class PingView(BaseView):
 
     @staticmethod
     async def get() -> Response:
-        return json_response(AppOnlineResponse().dict(), status=HTTPStatus.OK)
+        return APP_ONLINE()
+
+
+class PingDBView(BaseView):
+    """
+    Проверка готовности: Postgres отвечает, пул прогрет. Пока прогрев
+    не удался, отвечает 503 и повторяет его при каждой проверке, чтобы
+    балансировщик не слал запросы процессу с пустым пулом.
+    """
+    URL_PATH = '/ping_db'
+
+    async def get(self) -> Response:
+        app = self.request.app
+        db = app['pg_db_manager']
+        try:
+            if db.warm:
+                await asyncio.wait_for(db.ping(), DB_READY_TIMEOUT)
+            else:
+                await asyncio.wait_for(db.warm_up(), DB_READY_TIMEOUT)
+        except Exception as err:
+            app['log_manager'].log_error(err)
+            return DatabaseUnavailable()
+
+        return json_response(
+            DBOnlineResponse(warm=db.warm,
+                             pool=db.pool_state()).dict(),
+            status=HTTPStatus.OK
+        )
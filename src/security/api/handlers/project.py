@@ -1,20 +1,118 @@
+import asyncio
 from http import HTTPStatus
-from aiohttp.web import json_response, Response
+from aiohttp.web import Response, StreamResponse
 from security.api.handlers.base import BaseView
+from security.api.tracing import span
 from security.api.models import CreateProjectRequest, \
     CreateProjectResponse, GetProjectResponse, \
-    UpdateProjectRequest, UpdateProjectResponse, Rights
+    UpdateProjectRequest, UpdateProjectResponse, Rights, BulkRightsRequest, \
+    BulkRightsResponse, BulkRightsResult, ListProjectsRequest
 from security.api.errors import ProjectNotFound, DuplicateNameError, \
-    NotEnoughRights, AdminNotTarget, UserNotFound, UpdateRightsError
-from aiohttp import ClientSession, TCPConnector
+    NotEnoughRights, AdminNotTarget, UserNotFound
+from security.api.serialization import StaticResponse, json_response, \
+    read_json, dumps, CONTENT_TYPE
+
+# сколько проектов отправляется клиенту за один write
+STREAM_CHUNK_ROWS = 500
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        # для If-None-Match используется слабое сравнение
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+UPDATE_SUCCESS = StaticResponse(UpdateProjectResponse().dict(),
+                                HTTPStatus.OK)
+
+
+async def _prepend(first, rows):
+    """Строка first, прочитанная заранее, и остальные строки rows."""
+    if first is None:
+        return
+    yield first
+    async for row in rows:
+        yield row
 
 
 class ProjectView(BaseView):
     URL_PATH = '/project'
 
+    async def get(self) -> Response:
+        """
+        Проекты пользователя с правами. Постраничная выдача по id проекта:
+        следующая страница запрашивается с after равным next из ответа.
+        """
+        with span('validate'):
+            page = ListProjectsRequest(**self.request.rel_url.query)
+
+        rows = self.request.app['pg_db_manager'].project_list(
+            user_id=self.request['user_id'],
+            is_admin=self.request['is_admin'],
+            after=page.after,
+            limit=page.limit
+        )
+        # первая строка читается до отправки заголовков: ошибка или
+        # таймаут БД здесь ещё становятся обычным ответом с ошибкой
+        try:
+            first = await rows.__anext__()
+        except StopAsyncIteration:
+            first = None
+
+        response = StreamResponse(
+            status=HTTPStatus.OK,
+            headers={'Content-Type': CONTENT_TYPE}
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(self.request)
+        try:
+            await self.write_page(response, first, rows, page.limit)
+        except Exception as err:
+            self.abort_stream(err)
+        return response
+
+    @staticmethod
+    async def write_page(response: StreamResponse, first, rows,
+                         limit: int) -> None:
+        await response.write(b'{"projects":[')
+        chunk = []
+        prefix = b''
+        count = 0
+        last_id = None
+        async for project_id, name, grant, write, read in \
+                _prepend(first, rows):
+            if read is None:
+                # администратор без явной связи с проектом
+                grant, write, read = True, True, True
+            chunk.append(dumps({'project_id': project_id, 'name': name,
+                                'grant': grant, 'write': write,
+                                'read': read}))
+            count += 1
+            last_id = project_id
+            if len(chunk) == STREAM_CHUNK_ROWS:
+                await response.write(prefix + b','.join(chunk))
+                chunk.clear()
+                prefix = b','
+
+        if chunk:
+            await response.write(prefix + b','.join(chunk))
+
+        # неполная страница - последняя
+        next_after = last_id if count == limit else None
+        await response.write(b'],"next":' + dumps(next_after) + b'}')
+        await response.write_eof()
+
     async def post(self) -> Response:
-        body = await self.request.json()
-        project = CreateProjectRequest(**body)
+        with span('validate'):
+            body = await read_json(self.request)
+            project = CreateProjectRequest(**body)
 
         project_id = await self.request.app['pg_db_manager'].project_create(
             project.name)
@@ -26,212 +124,265 @@ class ProjectView(BaseView):
             project_id=project_id,
             user_id=self.request['user_id']
         )
+
         return json_response(
             CreateProjectResponse(project_id=project_id).dict(),
             status=HTTPStatus.CREATED)
 
 
-class ProjectNameView(BaseView):
-    URL_PATH = '/project/{project_name}'
+class ProjectAccessView(BaseView):
+    """Общая часть представлений, проверяющих права на проект из пути."""
 
-    async def post(self) -> Response:
-        body = await self.request.json()
-        on_change = UpdateProjectRequest(
-            project_name=self.request.match_info['project_name'],
-            **body
-        )
+    @staticmethod
+    def effective_rights(access) -> tuple:
+        """
+        Права (grant, write, read) на проект с учётом роли администратора:
+        у администратора без явной связи с проектом есть все права.
+        """
+        if access.read is not None:
+            return access.grant, access.write, access.read
+        if access.is_admin:
+            return True, True, True
+        return None
 
-        # TODO: проверить права на редактирование
+    async def get_access(self):
+        return await self.request.app['pg_db_manager'].access_get(
+            user_id=self.request['user_id'],
+            project_name=self.request.match_info['project_name']
+        )
 
-        is_admin = await self.request.app[
-            'pg_db_manager'].user_get_role_by_user_id(
-            self.request['user_id'])
 
-        if is_admin:
-            self.request.app['log_manager'].logger.debug(
-                f"{is_admin=}")
+class ProjectNameView(ProjectAccessView):
+    URL_PATH = '/project/{project_name}'
 
-            await self.request.app[
-                'pg_db_manager'].project_update_name_by_name(
-                project_name=on_change.project_name,
-                new_name=on_change.new_name
+    async def post(self) -> Response:
+        with span('validate'):
+            body = await read_json(self.request)
+            on_change = UpdateProjectRequest(
+                project_name=self.request.match_info['project_name'],
+                **body
             )
 
-            return json_response(UpdateProjectResponse().dict(),
-                                 status=HTTPStatus.OK)
-
-        access = await self.request.app['pg_db_manager'] \
-            .user_get_project(
-            user_id=self.request['user_id'],
-            project_name=self.request.match_info['project_name']
-        )
+        access = await self.get_access()
 
-        if not access:
+        if access is None or access.project_id is None:
+            if access is not None and access.is_admin:
+                return ProjectNotFound()
             return NotEnoughRights()
 
-        name, grant, write, read = \
-            await self.request.app['pg_db_manager'] \
-                .user_get_project_info(
-                user_id=self.request['user_id'],
-                project_name=self.request.match_info['project_name']
-            )
+        rights = self.effective_rights(access)
+        if rights is None:
+            return NotEnoughRights()
 
+        grant, write, read = rights
         if not write:
             return NotEnoughRights()
 
-        res = await self.request.app['pg_db_manager'].project_update_name(
-            user_id=self.request['user_id'],
-            project_name=on_change.project_name,
+        await self.request.app['pg_db_manager'].project_rename(
+            project_id=access.project_id,
             new_name=on_change.new_name
         )
 
-        if not res:
-            return ProjectNotFound()
-
-        return json_response(UpdateProjectResponse().dict(),
-                             status=HTTPStatus.OK)
+        return UPDATE_SUCCESS()
 
     async def patch(self) -> Response:
-        body = await self.request.json()
+        with span('validate'):
+            body = await read_json(self.request)
+            target_token = body['target_token']
+            new_rights = Rights(**self.request.rel_url.query)
 
-        params = self.request.rel_url.query
-        # проверяем, что у пользователя есть доступ к проекту
-        name = await self.request.app['pg_db_manager'] \
-            .user_get_project(
-            user_id=self.request['user_id'],
-            project_name=self.request.match_info['project_name']
-        )
+        # токен цели проверяется до первого запроса к БД: соединение
+        # запроса не простаивает, пока отвечает identity provider
+        yandex_id = await self.request.app['identity_client'].get_yandex_id(
+            target_token)
 
-        is_admin = await self.request.app[
-            'pg_db_manager'].user_get_role_by_user_id(
-            self.request['user_id'])
+        # проверяем, что у пользователя есть доступ к проекту
+        access = await self.get_access()
 
-        if name is None and not is_admin:
+        if access is None or access.project_id is None:
             return ProjectNotFound()
 
         # получаем информацию о правах пользоввателя на проект
+        rights = self.effective_rights(access)
+        if rights is None:
+            return ProjectNotFound()
 
-        if name is not None:
-            name, grant, read, write = \
-                await self.request.app['pg_db_manager'] \
-                    .user_get_project_info(
-                    user_id=self.request['user_id'],
-                    project_name=self.request.match_info['project_name']
-                )
-        else:
-            grant, read, write = True, True, True
-
+        grant, write, read = rights
         if not grant:
             return NotEnoughRights()
 
-        self.request.app['log_manager'].logger.debug(6)
+        if yandex_id is None:
+            return UserNotFound()
 
         # проверяем, что target - не админ
-        token = body['target_token']
-        conn = TCPConnector()
-        headers = {'Authorization': f'OAuth {token}'}
-        async with ClientSession(trust_env=True,
-                                 connector=conn) as session:
-            async with session.get(
-                    'https://login.yandex.ru/info?',
-                    headers=headers,
-                    ssl=False
-            ) as resp:
-                if resp.status == HTTPStatus.OK:
-                    yandex_id = (await resp.json())['id']
-                    user_id = await self.request.app[
-                        'pg_db_manager'].user_get_id(yandex_id)
-                    is_admin = await self.request.app[
-                        'pg_db_manager'].user_get_role_by_yandex_id(yandex_id)
-
-                    if is_admin:
-                        self.request.app['log_manager'].logger.debug(7)
-                        return AdminNotTarget()
-                else:
-                    self.request.app['log_manager'].logger.debug(8)
-                    return UserNotFound()
-
-        self.request.app['log_manager'].logger.debug(9)
-        rights = Rights(**params)
-        if (rights.read and not read) or (rights.write and not write) or (
-                rights.grant and not grant):
-            self.request.app['log_manager'].logger.debug(10)
-            return NotEnoughRights()
+        target = await self.request.app['pg_db_manager'].user_get_principal(
+            yandex_id)
 
-        # если нет связи с проектом - добавляем
-        self.request.app['log_manager'].logger.debug(11)
-        is_connect = await self.request.app[
-            'pg_db_manager'].user_has_project(
-            user_id=user_id,
-            project_name=self.request.match_info['project_name'])
+        if target is None:
+            return UserNotFound()
 
-        self.request.app['log_manager'].logger.debug(12)
+        target_id, target_is_admin = target
+        if target_is_admin:
+            return AdminNotTarget()
 
-        project_id = \
-            await self.request.app['pg_db_manager'].project_get_id_by_name(
-                project_name=self.request.match_info['project_name']
-            )
+        if (new_rights.read and not read) or \
+                (new_rights.write and not write) or \
+                (new_rights.grant and not grant):
+            return NotEnoughRights()
+
+        # связь с проектом создаётся или обновляется одним запросом
+        await self.request.app['pg_db_manager'].access_upsert(
+            user_id=target_id,
+            project_id=access.project_id,
+            write=new_rights.write,
+            read=new_rights.read,
+            grant=new_rights.grant
+        )
 
-        self.request.app['log_manager'].logger.debug(13)
+        return UPDATE_SUCCESS()
 
-        if not is_connect:
-            self.request.app['log_manager'].logger.debug(14)
-            await self.request.app['pg_db_manager'].access_create(
-                project_id=project_id,
-                user_id=user_id
-            )
+    @staticmethod
+    def etag(is_admin: bool, project_id: int, project_version: int,
+             access_version: int = None) -> str:
+        """Ответ GET меняется только вместе с одной из этих величин."""
+        return f'"{project_id}.{project_version}.{access_version or 0}.' \
+               f'{int(is_admin)}"'
 
-        is_ok = await self.request.app['pg_db_manager'].project_update_rights(
-            user_id=user_id,
-            project_id=project_id,
-            write=rights.write,
-            read=rights.read,
-            grant=rights.grant
-        )
+    async def get(self) -> Response:
+        user_id = self.request['user_id']
+        project_name = self.request.match_info['project_name']
+
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match:
+            # версии проверяются без полного запроса прав и сериализации
+            version = await self.request.app['pg_db_manager'] \
+                .access_version(project_name=project_name, user_id=user_id)
+            # без прав на проект ETag не сравнивается и не отдаётся:
+            # иначе 304 выдал бы существование проекта и его id
+            if version is not None and version[1] is not None and \
+                    (version[0] or version[3] is not None):
+                etag = self.etag(*version)
+                if etag_matches(if_none_match, etag):
+                    return Response(status=HTTPStatus.NOT_MODIFIED,
+                                    headers={'ETag': etag})
+
+        # одинаковые одновременные чтения ждут один запрос к БД
+        access = await self.request.app['project_reads'].do(
+            (user_id, project_name), self.get_access)
+
+        if access is None or access.project_id is None:
+            return ProjectNotFound()
+
+        rights = self.effective_rights(access)
+        if rights is None:
+            return ProjectNotFound()
 
-        if not is_ok:
-            return UpdateRightsError()
+        grant, write, read = rights
         return json_response(
-            UpdateProjectResponse().dict(),
-            status=HTTPStatus.OK
+            GetProjectResponse(name=access.project_name, grant=grant,
+                               read=read, write=write).dict(),
+            status=HTTPStatus.OK,
+            headers={'ETag': self.etag(access.is_admin, access.project_id,
+                                       access.project_version,
+                                       access.access_version)}
         )
 
-    async def get(self) -> Response:
-        params = self.request.rel_url.query
 
-        is_admin = await self.request.app[
-            'pg_db_manager'].user_get_role_by_user_id(
-            self.request['user_id'])
+class ProjectRightsView(ProjectAccessView):
+    URL_PATH = '/project/{project_name}/rights'
+
+    # токен не удалось проверить: identity provider недоступен или ответил
+    # ошибкой; цель получает статус identity-error, остальные применяются
+    IDENTITY_ERROR = object()
+
+    async def resolve_tokens(self, tokens: set) -> dict:
+        identity_client = self.request.app['identity_client']
+        tokens = list(tokens)
+        results = await asyncio.gather(
+            *(identity_client.get_yandex_id(token) for token in tokens),
+            return_exceptions=True)
+        yandex_ids = {}
+        for token, result in zip(tokens, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                self.request.app['log_manager'].log_error(result)
+                result = self.IDENTITY_ERROR
+            yandex_ids[token] = result
+        return yandex_ids
 
-        if is_admin:
-            name, grant, read, write = await self.request.app['pg_db_manager'] \
-                .user_get_project_info(
-                project_name=self.request.match_info['project_name']
-            )
+    async def patch(self) -> Response:
+        with span('validate'):
+            body = await read_json(self.request)
+            bulk = BulkRightsRequest(**body)
 
-            return json_response(
-                GetProjectResponse(name=name, grant=grant, read=read,
-                                   write=write).dict(),
-                status=HTTPStatus.OK
-            )
+        # токены проверяются до первого запроса к БД: соединение
+        # запроса не простаивает, пока отвечает identity provider
+        yandex_ids = await self.resolve_tokens(
+            {target.token for target in bulk.targets
+             if target.token is not None})
 
-        name = await self.request.app['pg_db_manager'] \
-            .user_get_project(
-            user_id=self.request['user_id'],
-            project_name=self.request.match_info['project_name']
-        )
+        access = await self.get_access()
 
-        if name is None:
+        if access is None or access.project_id is None:
             return ProjectNotFound()
 
-        name, grant, read, write = await self.request.app['pg_db_manager'] \
-            .user_get_project_info(
-            user_id=self.request['user_id'],
-            project_name=self.request.match_info['project_name']
+        rights = self.effective_rights(access)
+        if rights is None:
+            return ProjectNotFound()
+
+        grant, write, read = rights
+        if not grant:
+            return NotEnoughRights()
+
+        rows = await self.request.app['pg_db_manager'].user_get_many(
+            user_ids=[target.user_id for target in bulk.targets
+                      if target.user_id is not None],
+            yandex_ids=[yandex_id for yandex_id in yandex_ids.values()
+                        if isinstance(yandex_id, str)]
         )
+        by_user_id = {row.user_id: row for row in rows}
+        by_yandex_id = {row.yoauth_uid: row for row in rows}
+
+        results = []
+        # при повторах одного пользователя применяется последняя запись
+        changes = {}
+        for index, target in enumerate(bulk.targets):
+            if target.token is not None:
+                yandex_id = yandex_ids[target.token]
+                if yandex_id is self.IDENTITY_ERROR:
+                    results.append((index, None, 'identity-error'))
+                    continue
+                if yandex_id is None:
+                    results.append((index, None, 'invalid-token'))
+                    continue
+                row = by_yandex_id.get(yandex_id)
+            else:
+                row = by_user_id.get(target.user_id)
+
+            if row is None:
+                results.append((index, None, 'user-not-found'))
+            elif row.is_admin:
+                results.append((index, row.user_id, 'admin-can-not-be-target'))
+            elif (target.read and not read) or (target.write and not write) \
+                    or (target.grant and not grant):
+                results.append((index, row.user_id, 'not-enough-rights'))
+            else:
+                changes[row.user_id] = \
+                    (target.read, target.write, target.grant)
+                results.append((index, row.user_id, 'update-success'))
+
+        if changes:
+            await self.request.app['pg_db_manager'].access_set_many(
+                project_id=access.project_id,
+                rights=[(user_id, *new_rights)
+                        for user_id, new_rights in changes.items()]
+            )
 
         return json_response(
-            GetProjectResponse(name=name, grant=grant, read=read,
-                               write=write).dict(),
+            BulkRightsResponse(results=[
+                BulkRightsResult(index=index, user_id=user_id, status=status)
+                for index, user_id, status in results
+            ]).dict(),
             status=HTTPStatus.OK
         )
@@ -1,9 +1,13 @@
 from http import HTTPStatus
-from aiohttp.web import json_response, Response
-from aiohttp import ClientSession, TCPConnector
+from aiohttp.web import Response, StreamResponse
 from .base import BaseView
+from security.api.tracing import span
 from security.api.models import RegisterResponse, RegisterRequest
-from security.api.errors import InvalidToken
+from security.api.errors import InvalidToken, NotEnoughRights
+from security.api.serialization import StaticResponse, read_json, dumps
+from security.db.importer import UserImporter, ImportStats, split_lines
+
+REGISTERED = StaticResponse(RegisterResponse().dict(), HTTPStatus.CREATED)
 
 
 class RegisterView(BaseView):
@@ -12,26 +16,64 @@ class RegisterView(BaseView):
     async def post(self) -> Response:
         params = self.request.rel_url.query
 
-        body = await self.request.json()
-        user = RegisterRequest(**params, **body)
-
-        self.request.app['log_manager'].logger.debug(f'{user=}')
-
-        headers = {'Authorization': f'OAuth {user.token}'}
-        conn = TCPConnector()
-        async with ClientSession(trust_env=True,
-                                 connector=conn) as session:
-            async with session.get(
-                    'https://login.yandex.ru/info?',
-                    headers=headers,
-                    ssl=False
-            ) as resp:
-                if resp.status == HTTPStatus.OK:
-                    yandex_id = (await resp.json())['id']
-                    await self.request.app['pg_db_manager'].user_create(
-                        yandex_id, user.role == 'admin')
-                else:
-                    return InvalidToken()
-
-        return json_response(RegisterResponse().dict(),
-                             status=HTTPStatus.CREATED)
\ No newline at end of file
+        with span('validate'):
+            body = await read_json(self.request)
+            user = RegisterRequest(**params, **body)
+
+        yandex_id = await self.request.app['identity_client'].get_yandex_id(
+            user.token)
+        if yandex_id is None:
+            return InvalidToken()
+
+        await self.request.app['pg_db_manager'].user_create(
+            yandex_id, user.role == 'admin')
+        # токен мог попасть в кэш как отклонённый до регистрации
+        self.request.app['principal_cache'].invalidate(user.token)
+
+        return REGISTERED()
+
+
+class UserImportView(BaseView):
+    """
+    Массовый импорт пользователей, только для администратора. Тело
+    запроса - JSONL (формат строки описан в security.db.importer), ответ -
+    NDJSON: ошибки по номерам строк, прогресс после каждой пачки и итог.
+    """
+    URL_PATH = '/user/import'
+
+    async def post(self) -> Response:
+        if not self.request['is_admin']:
+            return NotEnoughRights()
+
+        response = StreamResponse(
+            status=HTTPStatus.OK,
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(self.request)
+
+        async def on_error(line_number: int, message: str) -> None:
+            await response.write(
+                dumps({'line': line_number, 'error': message}) + b'\n')
+
+        async def on_progress(stats: ImportStats) -> None:
+            await response.write(
+                dumps({'progress': stats.as_dict()}) + b'\n')
+
+        # тело читается уже после отправки заголовков, поэтому длина строки
+        # ограничена явно и превышение - ошибка записи, а не всего ответа
+        lines = split_lines(self.request.content.iter_any())
+        try:
+            stats = await UserImporter(self.request.app['pg_db_manager']) \
+                .run(lines, on_error, on_progress)
+        except Exception as err:
+            self.abort_stream(err)
+            return response
+        finally:
+            # роли и права могли поменяться в обход обработчиков
+            self.request.app['access_matrix'].clear()
+            self.request.app['principal_cache'].clear()
+
+        await response.write(dumps({'done': stats.as_dict()}) + b'\n')
+        await response.write_eof()
+        return response
@@ -0,0 +1,87 @@
+import asyncio
+from http import HTTPStatus
+from time import perf_counter
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from security.api.metrics import IDENTITY_REQUEST_SECONDS, \
+    IDENTITY_FAILURES
+from security.api.tracing import span
+from security.api.config import IDENTITY_URL, IDENTITY_POOL_LIMIT, \
+    IDENTITY_CONNECT_TIMEOUT, IDENTITY_READ_TIMEOUT, IDENTITY_VERIFY_SSL, \
+    IDENTITY_WARM_UP, IDENTITY_TOTAL_TIMEOUT
+
+
+class IdentityClient:
+    """
+    Долгоживущий клиент identity provider (login.yandex.ru/info).
+
+    Держит один пул keep-alive соединений на всё приложение, поэтому
+    TCP и TLS рукопожатия не повторяются на каждый запрос.
+    Открывается и закрывается вместе с приложением.
+    """
+
+    def __init__(self,
+                 base_url: str = IDENTITY_URL,
+                 limit: int = IDENTITY_POOL_LIMIT,
+                 connect_timeout: float = IDENTITY_CONNECT_TIMEOUT,
+                 read_timeout: float = IDENTITY_READ_TIMEOUT,
+                 total_timeout: float = IDENTITY_TOTAL_TIMEOUT,
+                 verify_ssl: bool = IDENTITY_VERIFY_SSL):
+        self.base_url = base_url.rstrip('/')
+        self.limit = limit
+        # sock_* не ограничивают ожидание соединения, когда пул занят
+        self.timeout = ClientTimeout(total=total_timeout,
+                                     sock_connect=connect_timeout,
+                                     sock_read=read_timeout)
+        self.verify_ssl = verify_ssl
+        self.session: Optional[ClientSession] = None
+
+    async def start(self) -> None:
+        if self.session is not None:
+            return
+        connector = TCPConnector(limit=self.limit, keepalive_timeout=30,
+                                 ssl=None if self.verify_ssl else False)
+        self.session = ClientSession(trust_env=True, connector=connector,
+                                     timeout=self.timeout)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def warm_up(self, connections: int = IDENTITY_WARM_UP) -> None:
+        """
+        Открывает keep-alive соединения одновременными запросами без
+        токена. Ответ не важен: соединение с завершённым TLS остаётся
+        в пуле для настоящих запросов.
+        """
+        await self.start()
+
+        async def touch():
+            async with self.session.get(f'{self.base_url}/info') as resp:
+                await resp.read()
+
+        await asyncio.gather(*(touch() for _ in range(connections)))
+
+    async def get_yandex_id(self, token: str) -> Optional[str]:
+        """Возвращает id пользователя в Яндексе или None, если токен
+        отклонён."""
+        if self.session is None:
+            await self.start()
+        headers = {'Authorization': f'OAuth {token}'}
+        started = perf_counter()
+        try:
+            with span('identity.info'):
+                async with self.session.get(f'{self.base_url}/info',
+                                            headers=headers) as resp:
+                    if resp.status != HTTPStatus.OK:
+                        IDENTITY_FAILURES.labels('rejected').inc()
+                        return None
+                    return (await resp.json())['id']
+        except Exception:
+            IDENTITY_FAILURES.labels('error').inc()
+            raise
+        finally:
+            IDENTITY_REQUEST_SECONDS.observe(perf_counter() - started)
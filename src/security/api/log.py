@@ -1,32 +1,58 @@
-from logging import getLogger, DEBUG, FileHandler, Formatter, Logger
+from logging import getLogger, Formatter, Logger
+from logging.handlers import QueueHandler, QueueListener, \
+    RotatingFileHandler, TimedRotatingFileHandler
+from queue import SimpleQueue
+
+from security.api.config import LOG_FILE, LOG_LEVEL, LOG_ROTATE_BYTES, \
+    LOG_ROTATE_WHEN, LOG_BACKUP_COUNT
 
 
 class LogManager:
-    def __init__(self):
+    """
+    Логгер приложения. Обработчики запросов только кладут записи в
+    очередь, в файл их пишет фоновый поток QueueListener, поэтому
+    дисковый ввод-вывод не блокирует event loop.
+    """
+
+    def __init__(self, filename: str = LOG_FILE):
         self.logger = getLogger('messenger-api')
-        self.handler = FileHandler('api_logs.txt', mode='a',
-                                   encoding='utf-8')
         self.basic_formatter = Formatter(
             "%(asctime)s %(levelname)s %(message)s")
 
-        self.logger.setLevel(DEBUG)
-        self.handler.setLevel(DEBUG)
+        if LOG_ROTATE_WHEN:
+            self.handler = TimedRotatingFileHandler(
+                filename, when=LOG_ROTATE_WHEN,
+                backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        else:
+            self.handler = RotatingFileHandler(
+                filename, mode='a', maxBytes=LOG_ROTATE_BYTES,
+                backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        self.handler.setLevel(LOG_LEVEL)
         self.handler.setFormatter(self.basic_formatter)
-        self.logger.addHandler(self.handler)
+
+        self.queue = SimpleQueue()
+        self.listener = QueueListener(self.queue, self.handler,
+                                      respect_handler_level=True)
+
+        self.logger.setLevel(LOG_LEVEL)
+        # повторное создание менеджера не должно дублировать записи
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, QueueHandler):
+                self.logger.removeHandler(handler)
+        self.logger.addHandler(QueueHandler(self.queue))
+        self.listener.start()
+        self.running = True
 
     @property
     def get_log(self) -> Logger:
         return self.logger
 
     def log_error(self, error: Exception) -> None:
-        # задаём новый формат записи в лог
-        err_formatter = Formatter(
-            f"%(asctime)s %(levelname)s %(message)s {error=}")
-        self.handler.setFormatter(err_formatter)
-        self.logger.addHandler(self.handler)
-
-        self.logger.error(error)  # записываем сообщение
+        self.logger.error('%s error=%r', error, error)
 
-        # возвращаемся к старым настройкам
-        self.handler.setFormatter(self.basic_formatter)
-        self.logger.addHandler(self.handler)
+    def stop(self) -> None:
+        """Дописывает оставшиеся в очереди записи и закрывает файл."""
+        if self.running:
+            self.listener.stop()
+            self.running = False
+        self.handler.close()
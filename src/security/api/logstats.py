@@ -0,0 +1,284 @@
+"""
+Разбор api_logs.txt: задержки и ошибки по маршрутам и обработчикам.
+
+Строки лога читаются потоком, память не зависит от размера файла:
+задержки копятся в гистограммах с фиксированными корзинами, самые
+медленные запросы — в куче ограниченного размера.
+
+Запрос учитывается по JSON-строке трассировки: middleware tracing пишет
+её ровно одну на запрос, с маршрутом, статусом и длительностью, так что
+порядок остальных строк не важен. В логах без трассировки (или с флагом
+--breadcrumbs) используются пары 'Handler "X" has been activated.' /
+'is finish his work.', привязанные к предшествующей строке
+request.rel_url. Ошибка (строка ERROR) между ними завершает запрос как
+ошибочный.
+
+    python -m security.api.logstats api_logs.txt --window 300
+"""
+import argparse
+import gzip
+import heapq
+import json
+import re
+import sys
+from collections import defaultdict, deque
+from datetime import datetime
+from math import log
+
+from security.api.handlers import HANDLERS
+
+LINE_RE = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) (\w+) (.*)$')
+REL_URL_RE = re.compile(r"^request\.rel_url=URL\('(.*)'\)$")
+START_RE = re.compile(r'^Handler "(\w+)" has been activated\.$')
+FINISH_RE = re.compile(r'^Handler "(\w+)" is finish his work\.$')
+
+# незавершённых запросов одного обработчика храним не больше этого
+MAX_OPEN = 1000
+
+ROUTES = [
+    (re.compile('^' + re.sub(r'\{\w+\}', '[^/]+', handler.URL_PATH) + '$'),
+     handler.URL_PATH)
+    for handler in HANDLERS
+]
+
+
+def normalize_route(url: str) -> str:
+    path = url.split('?', 1)[0]
+    for pattern, template in ROUTES:
+        if pattern.match(path):
+            return template
+    return path
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с геометрическими корзинами (шаг 10%)."""
+    BASE = 0.1
+    GROWTH = log(1.1)
+    SIZE = 170
+
+    def __init__(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency_ms: float, error: bool = False) -> None:
+        if latency_ms <= self.BASE:
+            index = 0
+        else:
+            index = min(int(log(latency_ms / self.BASE) / self.GROWTH) + 1,
+                        self.SIZE - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.errors += error
+        self.total += latency_ms
+        self.max = max(self.max, latency_ms)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= rank:
+                return min(self.BASE * (1.1 ** index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.count, 4)
+            if self.count else 0.0,
+            'mean_ms': round(self.total / self.count, 3)
+            if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max, 3),
+        }
+
+
+class LogStats:
+    def __init__(self, window: int = 0, slowest: int = 10):
+        self.window = window
+        self.slowest_size = slowest
+        self.routes = defaultdict(LatencyHistogram)
+        self.handlers = defaultdict(LatencyHistogram)
+        self.windows = defaultdict(LatencyHistogram)
+        self.slowest = []
+        self.last_url = None
+        self.open = defaultdict(deque)
+        self.unmatched = 0
+
+    def record(self, started: datetime, url: str, handler: str,
+               latency_ms: float, error: bool) -> None:
+        route = normalize_route(url) if url else 'unknown'
+        self.routes[route].add(latency_ms, error)
+        self.handlers[handler].add(latency_ms, error)
+        if self.window:
+            bucket = int(started.timestamp()) // self.window * self.window
+            self.windows[bucket].add(latency_ms, error)
+        item = (latency_ms, started.isoformat(sep=' '), url or '', handler)
+        if len(self.slowest) < self.slowest_size:
+            heapq.heappush(self.slowest, item)
+        elif item > self.slowest[0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def feed_breadcrumb(self, moment: datetime, level: str,
+                        message: str) -> None:
+        match = REL_URL_RE.match(message)
+        if match:
+            self.last_url = match.group(1)
+            return
+
+        match = START_RE.match(message)
+        if match:
+            pending = self.open[match.group(1)]
+            if len(pending) >= MAX_OPEN:
+                pending.popleft()
+                self.unmatched += 1
+            pending.append((moment, self.last_url))
+            self.last_url = None
+            return
+
+        match = FINISH_RE.match(message)
+        if match:
+            handler = match.group(1)
+            self.finish(handler, moment, error=False)
+            return
+
+        if level == 'ERROR':
+            # error_solving пишет ошибку вместо строки завершения;
+            # относим её к последнему начатому запросу
+            latest = max(
+                ((pending[-1][0], handler)
+                 for handler, pending in self.open.items() if pending),
+                default=None)
+            if latest is not None:
+                self.finish(latest[1], moment, error=True, newest=True)
+
+    def finish(self, handler: str, moment: datetime, error: bool,
+               newest: bool = False) -> None:
+        pending = self.open.get(handler)
+        if not pending:
+            self.unmatched += 1
+            return
+        started, url = pending.pop() if newest else pending.popleft()
+        latency_ms = (moment - started).total_seconds() * 1000
+        self.record(started, url, handler, latency_ms, error)
+
+    def feed_trace(self, moment: datetime, message: str) -> None:
+        if not message.startswith('{'):
+            return
+        try:
+            record = json.loads(message)
+        except ValueError:
+            return
+        if 'request_id' not in record:
+            return
+        self.record(moment, record.get('route') or record.get('path'),
+                    f"{record.get('method')} {record.get('route')}",
+                    record['duration_ms'], record.get('status', 0) >= 500)
+
+    def report(self) -> dict:
+        return {
+            'routes': {key: value.summary()
+                       for key, value in sorted(self.routes.items())},
+            'handlers': {key: value.summary()
+                         for key, value in sorted(self.handlers.items())},
+            'windows': {
+                datetime.fromtimestamp(key).isoformat(sep=' '):
+                    value.summary()
+                for key, value in sorted(self.windows.items())
+            },
+            'slowest': [
+                {'latency_ms': round(latency, 3), 'started': started,
+                 'url': url, 'handler': handler}
+                for latency, started, url, handler
+                in sorted(self.slowest, reverse=True)
+            ],
+            'unmatched': self.unmatched,
+        }
+
+
+def open_log(path: str):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def analyze(paths: list, window: int = 0, slowest: int = 10,
+            breadcrumbs: bool = False) -> dict:
+    traced = LogStats(window=window, slowest=slowest)
+    paired = LogStats(window=window, slowest=slowest)
+    for path in paths:
+        with open_log(path) as file:
+            for line in file:
+                match = LINE_RE.match(line.rstrip('\n'))
+                if match is None:
+                    continue
+                moment = datetime.fromisoformat(
+                    match.group(1).replace(',', '.'))
+                if not breadcrumbs:
+                    traced.feed_trace(moment, match.group(3))
+                paired.feed_breadcrumb(moment, match.group(2),
+                                       match.group(3))
+    # пары строк - только для логов, записанных до трассировки
+    return (traced if traced.routes else paired).report()
+
+
+def print_table(title: str, rows: dict) -> None:
+    if not rows:
+        return
+    print(title)
+    width = max(len(key) for key in rows) + 2
+    print(f"{'':<{width}}{'count':>8}{'err%':>8}{'p50':>10}{'p95':>10}"
+          f"{'p99':>10}{'max':>10}")
+    for key, row in rows.items():
+        print(f"{key:<{width}}{row['count']:>8}"
+              f"{row['error_rate'] * 100:>7.1f}%"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('paths', nargs='*', default=['api_logs.txt'],
+                        help="log files, .gz is supported, '-' for stdin")
+    parser.add_argument('--window', type=int, default=0,
+                        help='time bucket size in seconds')
+    parser.add_argument('--slowest', type=int, default=10)
+    parser.add_argument('--breadcrumbs', action='store_true',
+                        help='use handler breadcrumbs even if the log '
+                             'has JSON trace lines')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = analyze(args.paths, args.window, args.slowest,
+                     args.breadcrumbs)
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print_table('Routes, ms', report['routes'])
+    print_table('Handlers, ms', report['handlers'])
+    print_table('Windows, ms', report['windows'])
+    print('Slowest requests')
+    for item in report['slowest']:
+        print(f"{item['latency_ms']:>10.1f} ms  {item['started']}  "
+              f"{item['handler']}  {item['url']}")
+    if report['unmatched']:
+        print(f"\nUnmatched events: {report['unmatched']}")
+
+
+if __name__ == '__main__':
+    main()
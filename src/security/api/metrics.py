@@ -0,0 +1,196 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Минимальная реализация счётчиков, gauge и гистограмм без внешних
+зависимостей. Дочерние метрики с конкретными значениями меток
+создаются один раз и кэшируются, поэтому запись значения — это поиск
+в словаре и несколько сложений.
+"""
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+class Metric:
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.TYPE}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}{labels} {child.value}'
+
+
+class Gauge(Counter):
+    TYPE = 'gauge'
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('upper_bounds', 'counts', 'sum')
+
+    def __init__(self, upper_bounds: tuple):
+        self.upper_bounds = upper_bounds
+        # последняя корзина - +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values,
+                                        f'le="{bound}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {child.sum}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def expose(self) -> str:
+        return '\n'.join(metric.expose() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being served')
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency',
+    ('handler', 'method'))
+HTTP_RESPONSES = Counter(
+    'http_responses_total', 'Responses by status code',
+    ('handler', 'method', 'status'))
+
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'DBExecution.execute latency',
+    ('query',))
+DB_POOL_WAIT_SECONDS = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pool connection')
+DB_POOL = Gauge(
+    'db_pool_connections', 'Connection pool state', ('state',))
+
+IDENTITY_REQUEST_SECONDS = Histogram(
+    'identity_request_duration_seconds', 'Identity provider latency')
+IDENTITY_FAILURES = Counter(
+    'identity_request_failures_total',
+    'Identity provider calls that failed or rejected the token',
+    ('reason',))
+
+RIGHTS_CACHE_REQUESTS = Counter(
+    'rights_cache_requests_total', 'Rights cache lookups', ('result',))
+RIGHTS_CACHE_INVALIDATIONS = Counter(
+    'rights_cache_invalidations_total',
+    'Rights invalidation notifications received')
+
+ADMISSION_QUEUED = Gauge(
+    'admission_queued_requests', 'Requests waiting for an admission slot')
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total', 'Requests shed by admission control',
+    ('reason',))
+
+SINGLE_FLIGHT_CALLS = Counter(
+    'single_flight_calls_total',
+    'Coalesced lookups: leader ran the query, shared reused its result',
+    ('name', 'result'))
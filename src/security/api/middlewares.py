@@ -1,18 +1,115 @@
-from aiohttp.web import middleware, Response, Request
-from aiohttp import ClientSession, TCPConnector
+from aiohttp.web import middleware, Response, Request, HTTPException
+from time import perf_counter
 from typing import Callable
+from uuid import uuid4
 from os import environ
 from http import HTTPStatus
 from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
 
+from security.api.admission import CRITICAL, request_priority
+from security.api.cache import Principal
+from security.api.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, \
+    HTTP_RESPONSES
+from security.api.serialization import dumps
+from security.api.tracing import Trace, current_trace
 from security.api.errors import BadParametersError, \
     AuthorizationRequired, UserNotFound, DuplicateNameError, ServiceError
 
 
+@middleware
+async def metrics(request: Request, handler: Callable) -> Response:
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'none'
+    status = HTTPStatus.INTERNAL_SERVER_ERROR
+    started = perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except HTTPException as err:
+        status = err.status
+        raise
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        HTTP_REQUEST_SECONDS.labels(route, request.method) \
+            .observe(perf_counter() - started)
+        HTTP_RESPONSES.labels(route, request.method, int(status)).inc()
+
+
+@middleware
+async def tracing(request: Request, handler: Callable) -> Response:
+    """
+    Присваивает запросу идентификатор и пишет по завершении одну
+    JSON-строку с длительностью запроса и его отрезков.
+    """
+    request_id = request.headers.get('X-Request-Id', '')[:64] or \
+        uuid4().hex
+    trace = Trace(request_id)
+    token = current_trace.set(trace)
+    status = HTTPStatus.INTERNAL_SERVER_ERROR
+    try:
+        response = await handler(request)
+        status = response.status
+        if not response.prepared:
+            response.headers['X-Request-Id'] = request_id
+        return response
+    except HTTPException as err:
+        status = err.status
+        raise
+    finally:
+        current_trace.reset(token)
+        resource = request.match_info.route.resource
+        record = trace.as_dict()
+        record.update(
+            method=request.method,
+            path=request.path,
+            route=resource.canonical if resource is not None else None,
+            status=int(status),
+            user_id=request.get('user_id'),
+        )
+        request.app['log_manager'].logger.info(dumps(record).decode())
+
+
+@middleware
+async def admission(request: Request, handler: Callable) -> Response:
+    """
+    Ограничивает число одновременных запросов до того, как они займут
+    соединение с БД или пойдут в identity provider.
+    """
+    priority = request_priority(request)
+    if priority == CRITICAL:
+        return await handler(request)
+
+    controller = request.app['admission']
+    # пользователь ещё не известен, клиента различаем по токену;
+    # запросы без токена ограничиваются только общим лимитом
+    user_key = request.headers.get('Authorization') or None
+    error = await controller.acquire(user_key, priority)
+    if error is not None:
+        response = error()
+        response.headers['Retry-After'] = '1'
+        return response
+    try:
+        return await handler(request)
+    finally:
+        controller.release(user_key)
+
+
+@middleware
+async def db_session(request: Request, handler: Callable) -> Response:
+    # все обращения к БД в рамках запроса идут через одно соединение
+    async with request.app['pg_db_manager'].unit_of_work():
+        return await handler(request)
+
+
 @middleware
 async def error_solving(request: Request, handler: Callable) -> Response:
     try:
+        # logstats связывает строку активации с предшествующим rel_url,
+        # поэтому обе пишутся здесь и в этом порядке
+        request.app['log_manager'].logger.debug(f"{request.rel_url=}")
         request.app['log_manager'].logger.debug(
             f'Handler "{handler.__name__}" has been activated.')
         response = await handler(request)
@@ -36,38 +133,35 @@ async def error_solving(request: Request, handler: Callable) -> Response:
         return ServiceError()
 
 
+async def resolve_principal(request: Request, auth_token: str):
+    yandex_id = await request.app['identity_client'].get_yandex_id(auth_token)
+    if yandex_id is None:
+        return None
+
+    row = await request.app['pg_db_manager'].user_get_principal(yandex_id)
+    request.app['log_manager'].logger.debug(f"{row=}")
+    return Principal(*row) if row is not None else None
+
+
 @middleware
 async def authorization(request: Request, handler: Callable):
-    not_required = ['/ping', '/ping_db', '/user', '/user?role=admin']
-    request.app['log_manager'].logger.debug(f"{request.rel_url=}")
+    not_required = ['/ping', '/ping_db', '/metrics', '/user',
+                    '/user?role=admin']
     if str(request.rel_url) in not_required or environ.get("AUTH_DISABLED",
                                                            False):
         return await handler(request)
-    else:
-        auth_token = request.headers.get('Authorization')
-        headers = {'Authorization': f'OAuth {auth_token}'}
-
-        conn = TCPConnector()
-
-        if auth_token:
-            async with ClientSession(trust_env=True,
-                                     connector=conn) as session:
-                async with session.get(
-                        'https://login.yandex.ru/info?',
-                        headers=headers,
-                        ssl=False
-                ) as resp:
-                    if resp.status == HTTPStatus.OK:
-                        yandex_id = (await resp.json())['id']
-                        user_id = await request.app[
-                            'pg_db_manager'].user_get_id(yandex_id)
-                        request.app['log_manager'].logger.debug(
-                            f"{user_id=}")
-                        is_correct = True if user_id is not None else False
-
-            if is_correct:
-                request['user_id'] = user_id
-                return await handler(request)
-            else:
-                return UserNotFound()
+
+    auth_token = request.headers.get('Authorization')
+    if not auth_token:
         return AuthorizationRequired()
+
+    principal = await request.app['principal_cache'].get(
+        auth_token,
+        lambda: resolve_principal(request, auth_token)
+    )
+    if principal is None:
+        return UserNotFound()
+
+    request['user_id'] = principal.user_id
+    request['is_admin'] = principal.is_admin
+    return await handler(request)
@@ -1,5 +1,6 @@
-from typing import Optional
-from pydantic import Field, BaseModel, AnyHttpUrl
+from typing import Dict, List, Literal, Optional
+from pydantic import Field, BaseModel, AnyHttpUrl, conlist, conint, \
+    root_validator
 
 
 class DefaultErrorResponse(BaseModel):
@@ -20,6 +21,12 @@ class AppOnlineResponse(BaseModel):
     message: str = "app-is-online"
 
 
+class DBOnlineResponse(BaseModel):
+    message: str = 'db-is-online'
+    warm: bool = Field(description='connection pool warm-up succeeded')
+    pool: Dict[str, int] = Field(description='connection pool state')
+
+
 class CreateProjectRequest(BaseModel):
     name: str
 
@@ -28,6 +35,11 @@ class CreateProjectResponse(BaseModel):
     project_id: int
 
 
+class ListProjectsRequest(BaseModel):
+    after: int = Field(default=0, description='last project id seen')
+    limit: conint(ge=1, le=10000) = Field(default=100)
+
+
 class GetProjectRequest(BaseModel):
     project_name: str
 
@@ -49,6 +61,60 @@ class UpdateProjectResponse(BaseModel):
 
 
 class Rights(BaseModel):
-    read: bool = Field(default='False')
-    write: bool = Field(default='False')
-    grant: bool = Field(default='False')
+    read: bool = Field(default=False)
+    write: bool = Field(default=False)
+    grant: bool = Field(default=False)
+
+
+class ImportGrant(Rights):
+    project: str = Field(min_length=1)
+
+
+class ImportUserRecord(BaseModel):
+    """Строка JSONL для массового импорта пользователей."""
+    yandex_id: str = Field(min_length=1)
+    role: Literal['user', 'admin'] = Field(default='user')
+    grants: List[ImportGrant] = Field(default_factory=list)
+
+
+class CreateGroupRequest(BaseModel):
+    name: str = Field(min_length=1)
+
+
+class CreateGroupResponse(BaseModel):
+    group_id: int
+
+
+class GroupMembersRequest(BaseModel):
+    user_ids: conlist(int, min_items=1, max_items=1000)
+
+
+class GroupMembersResponse(BaseModel):
+    changed: List[int] = Field(description='users added or removed')
+    skipped: List[int] = Field(
+        description='unknown users, already members or not members')
+
+
+class BulkRightsTarget(Rights):
+    token: Optional[str]
+    user_id: Optional[int]
+
+    @root_validator(skip_on_failure=True)
+    def check_target(cls, values):
+        if (values.get('token') is None) == (values.get('user_id') is None):
+            raise ValueError('either token or user_id is required')
+        return values
+
+
+class BulkRightsRequest(BaseModel):
+    targets: conlist(BulkRightsTarget, min_items=1, max_items=1000)
+
+
+class BulkRightsResult(BaseModel):
+    index: int
+    user_id: Optional[int]
+    status: str
+
+
+class BulkRightsResponse(BaseModel):
+    results: List[BulkRightsResult]
@@ -0,0 +1,60 @@
+"""
+Сериализация JSON для ответов и тел запросов.
+
+Кодировщик выбирается один раз при импорте (JSON_BACKEND): orjson, если
+он установлен, иначе стандартный json. Ответы с постоянным телом
+сериализуются заранее — на каждый запрос создаётся только Response
+с готовыми байтами.
+"""
+import json
+from http import HTTPStatus
+
+from aiohttp.web import Request, Response
+
+from security.api.config import JSON_BACKEND
+
+CONTENT_TYPE = 'application/json'
+
+try:
+    if JSON_BACKEND != 'orjson':
+        raise ImportError(JSON_BACKEND)
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(data) -> bytes:
+        return orjson.dumps(data)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(data) -> bytes:
+        return _encoder.encode(data).encode('utf-8')
+
+    loads = json.loads
+
+
+def json_response(data, status: int = HTTPStatus.OK,
+                  headers: dict = None) -> Response:
+    return Response(body=dumps(data), status=status, headers=headers,
+                    content_type=CONTENT_TYPE)
+
+
+async def read_json(request: Request):
+    """Тело запроса в виде JSON, без промежуточного декодирования в str."""
+    return loads(await request.read())
+
+
+class StaticResponse:
+    """Ответ с телом, сериализованным один раз при создании."""
+
+    def __init__(self, data, status: int = HTTPStatus.OK):
+        self.body = dumps(data)
+        self.status = status
+
+    def __call__(self) -> Response:
+        return Response(body=self.body, status=self.status,
+                        content_type=CONTENT_TYPE)
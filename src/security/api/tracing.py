@@ -0,0 +1,76 @@
+from contextvars import ContextVar
+from time import perf_counter
+
+current_trace = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """
+    Замеры одного HTTP-запроса: идентификатор запроса и список
+    именованных отрезков (name, start_ms, duration_ms) от его начала.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = perf_counter()
+        self.spans = []
+
+    def elapsed_ms(self) -> float:
+        return (perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> dict:
+        return {
+            'request_id': self.request_id,
+            'duration_ms': round(self.elapsed_ms(), 3),
+            'spans': [
+                {'name': name, 'start_ms': round(start, 3),
+                 'duration_ms': round(duration, 3)}
+                for name, start, duration in self.spans
+            ],
+        }
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        finished = perf_counter()
+        self.trace.spans.append((
+            self.name,
+            (self.started - self.trace.started) * 1000,
+            (finished - self.started) * 1000,
+        ))
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name: str):
+    """
+    Отрезок текущего запроса. Вне запроса (скрипты, фоновые задачи)
+    ничего не замеряет.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name)
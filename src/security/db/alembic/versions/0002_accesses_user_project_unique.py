@@ -0,0 +1,32 @@
+"""accesses user project unique
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # оставляем по одной (последней) строке на пару пользователь-проект
+    op.execute(
+        'DELETE FROM accesses a USING accesses b '
+        'WHERE a.user_id = b.user_id AND a.project_id = b.project_id '
+        'AND a.id < b.id'
+    )
+    op.create_unique_constraint('accesses_user_id_project_id_key',
+                                'accesses', ['user_id', 'project_id'])
+
+
+def downgrade():
+    op.drop_constraint('accesses_user_id_project_id_key', 'accesses',
+                       type_='unique')
@@ -0,0 +1,51 @@
+"""accesses lookup indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+SWAP_UNIQUE_KEY = (
+    'ALTER TABLE accesses '
+    'DROP CONSTRAINT accesses_user_id_project_id_key, '
+    'ADD CONSTRAINT accesses_user_id_project_id_key UNIQUE USING INDEX {}'
+)
+
+
+def upgrade():
+    # уникальный ключ из 0002 пересобирается покрывающим: проверка прав
+    # читает только индекс, а второй индекс по (user_id, project_id) не
+    # нужен. CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('accesses_user_id_project_id_rights_key', 'accesses',
+                        ['user_id', 'project_id'], unique=True,
+                        postgresql_include=['read', 'write', 'grant'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_accesses_project_id_user_id', 'accesses',
+                        ['project_id', 'user_id'],
+                        postgresql_concurrently=True)
+    # подмена ограничения не перестраивает индекс, а только
+    # переименовывает его в accesses_user_id_project_id_key
+    op.execute(SWAP_UNIQUE_KEY.format(
+        'accesses_user_id_project_id_rights_key'))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_accesses_project_id_user_id', 'accesses',
+                      postgresql_concurrently=True)
+        op.create_index('accesses_user_id_project_id_plain_key', 'accesses',
+                        ['user_id', 'project_id'], unique=True,
+                        postgresql_concurrently=True)
+    op.execute(SWAP_UNIQUE_KEY.format('accesses_user_id_project_id_plain_key'))
@@ -0,0 +1,32 @@
+"""projects and accesses version counters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # столбец с постоянным значением по умолчанию добавляется без
+    # перезаписи таблицы
+    op.add_column('projects',
+                  sa.Column('version', sa.Integer(), server_default='1',
+                            nullable=False))
+    op.add_column('accesses',
+                  sa.Column('version', sa.Integer(), server_default='1',
+                            nullable=False))
+
+
+def downgrade():
+    op.drop_column('accesses', 'version')
+    op.drop_column('projects', 'version')
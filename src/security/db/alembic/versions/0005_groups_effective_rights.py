@@ -0,0 +1,104 @@
+"""groups, group grants and materialized effective rights
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'groups',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table(
+        'group_members',
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('group_id', 'user_id')
+    )
+    op.create_index('ix_group_members_user_id_group_id', 'group_members',
+                    ['user_id', 'group_id'])
+    op.create_table(
+        'group_accesses',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('read', sa.Boolean(), nullable=False),
+        sa.Column('write', sa.Boolean(), nullable=False),
+        sa.Column('grant', sa.Boolean(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('group_id', 'project_id',
+                            name='group_accesses_group_id_project_id_key')
+    )
+    op.create_index('ix_group_accesses_project_id', 'group_accesses',
+                    ['project_id'])
+
+    op.execute(sa.schema.CreateSequence(
+        sa.Sequence('effective_accesses_version_seq')))
+    op.create_table(
+        'effective_accesses',
+        sa.Column('id', sa.BigInteger(), autoincrement=True,
+                  nullable=False),
+        sa.Column('read', sa.Boolean(), nullable=False),
+        sa.Column('write', sa.Boolean(), nullable=False),
+        sa.Column('grant', sa.Boolean(), nullable=False),
+        sa.Column('version', sa.BigInteger(),
+                  server_default=sa.text(
+                      "nextval('effective_accesses_version_seq')"),
+                  nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # групп ещё нет, поэтому эффективные права совпадают с прямыми;
+    # индексы строятся после заполнения, так быстрее
+    op.execute('''
+        INSERT INTO effective_accesses
+            (user_id, project_id, read, write, "grant")
+        SELECT user_id, project_id, read, write, "grant"
+        FROM accesses
+    ''')
+    op.create_index('ix_effective_accesses_user_id_project_id_rights',
+                    'effective_accesses', ['user_id', 'project_id'],
+                    unique=True,
+                    postgresql_include=['read', 'write', 'grant', 'version'])
+    op.create_index('ix_effective_accesses_project_id_user_id',
+                    'effective_accesses', ['project_id', 'user_id'])
+
+
+def downgrade():
+    op.drop_table('effective_accesses')
+    op.execute(sa.schema.DropSequence(
+        sa.Sequence('effective_accesses_version_seq')))
+    op.drop_index('ix_group_accesses_project_id', 'group_accesses')
+    op.drop_table('group_accesses')
+    op.drop_index('ix_group_members_user_id_group_id', 'group_members')
+    op.drop_table('group_members')
+    op.drop_table('groups')
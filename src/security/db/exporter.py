@@ -0,0 +1,183 @@
+"""
+Выгрузка прав для аудита: пользователи, проекты, группы и права.
+
+Все наборы читаются в одной транзакции REPEATABLE READ READ ONLY, поэтому
+выгрузка соответствует одному моменту времени, даже если права меняются
+во время её работы. Данные отдаёт сам Postgres через COPY ... TO STDOUT,
+включая NDJSON (row_to_json), а Python только сжимает поток кусками
+и пишет в файл - память не зависит от числа строк.
+
+Транзакция держит снимок до конца выгрузки, что на время работы
+задерживает VACUUM; запускать лучше на реплике или в спокойные часы.
+
+    python -m security.db.exporter audit/ --format ndjson
+    python -m security.db.exporter - --datasets matrix > matrix.csv.gz
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+from time import monotonic
+from typing import BinaryIO
+
+from security.db.manager import DBManager
+
+DATASETS = {
+    'users': '''
+        SELECT id, yoauth_uid, is_admin
+        FROM users
+    ''',
+    'projects': '''
+        SELECT id, name, version
+        FROM projects
+    ''',
+    'accesses': '''
+        SELECT id, user_id, project_id, read, write, "grant", version
+        FROM accesses
+    ''',
+    # прямые права из accesses
+    'matrix': '''
+        SELECT u.id AS user_id, u.yoauth_uid, u.is_admin,
+               p.id AS project_id, p.name AS project_name,
+               a.read, a.write, a."grant", a.version
+        FROM accesses a
+        JOIN users u ON u.id = a.user_id
+        JOIN projects p ON p.id = a.project_id
+    ''',
+    'groups': '''
+        SELECT id, name
+        FROM groups
+    ''',
+    'group_members': '''
+        SELECT group_id, user_id
+        FROM group_members
+    ''',
+    'group_accesses': '''
+        SELECT id, group_id, project_id, read, write, "grant"
+        FROM group_accesses
+    ''',
+    # итоговые права с учётом групп
+    'effective': '''
+        SELECT u.id AS user_id, u.yoauth_uid, u.is_admin,
+               p.id AS project_id, p.name AS project_name,
+               e.read, e.write, e."grant", e.version
+        FROM effective_accesses e
+        JOIN users u ON u.id = e.user_id
+        JOIN projects p ON p.id = e.project_id
+    ''',
+}
+
+FORMATS = ('csv', 'ndjson')
+
+# row_to_json экранирует управляющие символы, поэтому \x01 и \x02 в тексте
+# не встречаются: CSV с такими кавычками и разделителем отдаёт JSON как есть,
+# без экранирования, которое добавил бы текстовый формат COPY
+NDJSON_COPY = {'format': 'csv', 'quote': '\x01', 'delimiter': '\x02'}
+
+
+def copy_query(query: str, output_format: str) -> str:
+    if output_format == 'ndjson':
+        return f'SELECT row_to_json(t) FROM ({query}) t'
+    return query
+
+
+def copy_options(output_format: str) -> dict:
+    if output_format == 'ndjson':
+        return NDJSON_COPY
+    return {'format': 'csv', 'header': True}
+
+
+def copied_rows(status: str) -> int:
+    # статус команды вида 'COPY 42'
+    return int(status.rsplit(' ', 1)[-1])
+
+
+def compressed(file: BinaryIO, compress: int) -> BinaryIO:
+    if not compress:
+        return file
+    # mtime=0: одинаковые данные дают одинаковый архив
+    return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=compress,
+                         mtime=0)
+
+
+class SnapshotExporter:
+    def __init__(self, db_manager: DBManager, output_format: str = 'csv',
+                 compress: int = 6):
+        self.db_manager = db_manager
+        self.output_format = output_format
+        self.compress = compress
+
+    def file_name(self, dataset: str) -> str:
+        name = f'{dataset}.{self.output_format}'
+        return f'{name}.gz' if self.compress else name
+
+    async def run(self, datasets: list, destination: str) -> dict:
+        """
+        Выгружает наборы в файлы каталога destination ('-' - один набор
+        в stdout). Возвращает число строк по наборам.
+        """
+        if destination != '-':
+            os.makedirs(destination, exist_ok=True)
+        counts = {}
+        async with self.db_manager.raw_connection() as connection:
+            async with connection.transaction(isolation='repeatable_read',
+                                              readonly=True):
+                for dataset in datasets:
+                    path = destination if destination == '-' else \
+                        os.path.join(destination, self.file_name(dataset))
+                    counts[dataset] = await self.export(connection, dataset,
+                                                        path)
+        return counts
+
+    async def export(self, connection, dataset: str, path: str) -> int:
+        file = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        output = compressed(file, self.compress)
+        try:
+            status = await connection.copy_from_query(
+                copy_query(DATASETS[dataset], self.output_format),
+                # asyncpg пишет в файловый объект из пула потоков,
+                # сжатие не блокирует event loop
+                output=output,
+                **copy_options(self.output_format))
+        finally:
+            if output is not file:
+                # GzipFile дописывает хвост, но не закрывает файл
+                output.close()
+            if file is sys.stdout.buffer:
+                file.flush()
+            else:
+                file.close()
+        return copied_rows(status)
+
+
+async def main(args) -> int:
+    if args.destination == '-' and len(args.datasets) != 1:
+        print('exactly one dataset can be written to stdout',
+              file=sys.stderr)
+        return 2
+
+    db_manager = DBManager()
+    exporter = SnapshotExporter(db_manager, args.format, args.compress)
+    started = monotonic()
+    try:
+        counts = await exporter.run(args.datasets, args.destination)
+    finally:
+        await db_manager.dispose()
+    for dataset, count in counts.items():
+        print(f'{dataset}: {count} rows', file=sys.stderr)
+    print(f'done in {monotonic() - started:.1f}s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('destination',
+                        help="output directory, '-' for stdout")
+    parser.add_argument('--datasets', nargs='+', choices=tuple(DATASETS),
+                        default=list(DATASETS))
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--compress', type=int, default=6,
+                        choices=range(0, 10), metavar='0-9',
+                        help='gzip level, 0 disables compression')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,302 @@
+"""
+Массовый импорт пользователей из JSONL.
+
+Строка файла: {"yandex_id": "...", "role": "user|admin",
+"grants": [{"project": "...", "read": true, "write": false,
+"grant": false}]}.
+
+Записи читаются потоком и пачками загружаются через COPY во временные
+таблицы, откуда переносятся в users и accesses несколькими запросами
+INSERT ... ON CONFLICT; для затронутых пар пользователь-проект в той же
+транзакции пересчитываются effective_accesses. Каждая пачка - отдельная
+транзакция, поэтому
+память не зависит от размера файла, а ошибка в одной пачке не отменяет
+уже загруженные. При повторах одного пользователя или пары
+пользователь-проект применяется последняя запись.
+
+    python -m security.db.importer users.jsonl --errors errors.jsonl
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import AsyncIterable, Awaitable, Callable, Optional
+
+import asyncpg
+from pydantic import ValidationError
+
+from security.api.config import RIGHTS_CHANNEL
+from security.api.models import ImportUserRecord
+from security.api.serialization import loads
+from security.db.manager import DBManager
+from security.db.queries import effective_lock_sql, effective_refresh_sql
+
+BATCH_SIZE = 10000
+# строка длиннее этого не разбирается и считается ошибочной
+MAX_LINE_BYTES = 1 << 20
+
+STAGING_TABLES = '''
+CREATE TEMP TABLE IF NOT EXISTS import_users (
+    line integer NOT NULL,
+    yoauth_uid text NOT NULL,
+    is_admin boolean NOT NULL
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS import_grants (
+    line integer NOT NULL,
+    yoauth_uid text NOT NULL,
+    project_name text NOT NULL,
+    read boolean NOT NULL,
+    write boolean NOT NULL,
+    "grant" boolean NOT NULL
+) ON COMMIT DELETE ROWS
+'''
+
+USER_COLUMNS = ('line', 'yoauth_uid', 'is_admin')
+GRANT_COLUMNS = ('line', 'yoauth_uid', 'project_name', 'read', 'write',
+                 'grant')
+
+MERGE_USERS = '''
+INSERT INTO users (yoauth_uid, is_admin)
+SELECT DISTINCT ON (yoauth_uid) yoauth_uid, is_admin
+FROM import_users
+ORDER BY yoauth_uid, line DESC
+ON CONFLICT (yoauth_uid) DO UPDATE SET is_admin = excluded.is_admin
+WHERE users.is_admin IS DISTINCT FROM excluded.is_admin
+'''
+
+MISSING_PROJECTS = '''
+SELECT g.line, g.project_name
+FROM import_grants g
+LEFT JOIN projects p ON p.name = g.project_name
+WHERE p.id IS NULL
+ORDER BY g.line
+'''
+
+MERGE_GRANTS = '''
+INSERT INTO accesses (user_id, project_id, read, write, "grant")
+SELECT DISTINCT ON (u.id, p.id) u.id, p.id, g.read, g.write, g."grant"
+FROM import_grants g
+JOIN users u ON u.yoauth_uid = g.yoauth_uid
+JOIN projects p ON p.name = g.project_name
+ORDER BY u.id, p.id, g.line DESC
+ON CONFLICT (user_id, project_id) DO UPDATE
+SET read = excluded.read, write = excluded.write,
+    "grant" = excluded."grant", version = accesses.version + 1
+'''
+
+# пары пачки, для которых пересчитываются эффективные права
+IMPORTED_PAIRS = '''
+SELECT u.id AS user_id, p.id AS project_id
+FROM import_grants g
+JOIN users u ON u.yoauth_uid = g.yoauth_uid
+JOIN projects p ON p.name = g.project_name
+'''
+
+LOCK_EFFECTIVE = effective_lock_sql(IMPORTED_PAIRS)
+REFRESH_EFFECTIVE = effective_refresh_sql(IMPORTED_PAIRS)
+
+NOTIFY = 'SELECT pg_notify($1, $2)'
+
+ErrorCallback = Callable[[int, str], Awaitable[None]]
+
+
+def affected_rows(status: str) -> int:
+    # статус команды вида 'INSERT 0 42'
+    return int(status.rsplit(' ', 1)[-1])
+
+
+class ImportStats:
+    def __init__(self):
+        self.lines = 0
+        self.users = 0
+        self.grants = 0
+        self.errors = 0
+        self.batches = 0
+
+    def as_dict(self) -> dict:
+        return {'lines': self.lines, 'users': self.users,
+                'grants': self.grants, 'errors': self.errors,
+                'batches': self.batches}
+
+
+class UserImporter:
+    def __init__(self, db_manager: DBManager, batch_size: int = BATCH_SIZE):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+
+    async def run(self, lines: AsyncIterable,
+                  on_error: ErrorCallback,
+                  on_progress: Optional[Callable[[ImportStats],
+                                                 Awaitable[None]]] = None
+                  ) -> ImportStats:
+        stats = ImportStats()
+        users, grants = [], []
+        async with self.db_manager.raw_connection() as connection:
+            await connection.execute(STAGING_TABLES)
+            async for line in lines:
+                stats.lines += 1
+                if line is None:
+                    stats.errors += 1
+                    await on_error(stats.lines, 'line-too-long')
+                    continue
+                if not line.strip():
+                    continue
+                record = await self.parse(stats.lines, line, on_error)
+                if record is None:
+                    stats.errors += 1
+                    continue
+
+                users.append((stats.lines, record.yandex_id,
+                              record.role == 'admin'))
+                grants.extend(
+                    (stats.lines, record.yandex_id, grant.project,
+                     grant.read, grant.write, grant.grant)
+                    for grant in record.grants)
+
+                if len(users) >= self.batch_size:
+                    await self.flush(connection, users, grants, stats,
+                                     on_error)
+                    users, grants = [], []
+                    if on_progress is not None:
+                        await on_progress(stats)
+
+            if users:
+                await self.flush(connection, users, grants, stats, on_error)
+        if on_progress is not None:
+            await on_progress(stats)
+        return stats
+
+    @staticmethod
+    async def parse(line_number: int, line,
+                    on_error: ErrorCallback) -> Optional[ImportUserRecord]:
+        try:
+            return ImportUserRecord(**loads(line))
+        except ValidationError as err:
+            await on_error(line_number, '; '.join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in err.errors()))
+        except (ValueError, TypeError):
+            await on_error(line_number, 'invalid-json')
+        return None
+
+    async def flush(self, connection, users: list, grants: list,
+                    stats: ImportStats, on_error: ErrorCallback) -> None:
+        stats.batches += 1
+        try:
+            async with connection.transaction():
+                await connection.copy_records_to_table(
+                    'import_users', records=users, columns=USER_COLUMNS)
+                merged_users = affected_rows(
+                    await connection.execute(MERGE_USERS))
+
+                missing = []
+                merged_grants = 0
+                if grants:
+                    await connection.copy_records_to_table(
+                        'import_grants', records=grants,
+                        columns=GRANT_COLUMNS)
+                    missing = await connection.fetch(MISSING_PROJECTS)
+                    merged_grants = affected_rows(
+                        await connection.execute(MERGE_GRANTS))
+                    await connection.execute(LOCK_EFFECTIVE)
+                    await connection.execute(REFRESH_EFFECTIVE)
+
+                # права меняются пачкой, поэтому кэши сбрасываются целиком
+                await connection.execute(NOTIFY, RIGHTS_CHANNEL,
+                                         json.dumps({'all': True}))
+        except asyncpg.PostgresError as err:
+            # транзакция пачки откатилась целиком
+            stats.errors += len(users)
+            for line_number, *_ in users:
+                await on_error(line_number, f'batch-failed: {err}')
+            return
+
+        self.db_manager.rights_cache.apply({'all': True})
+        stats.users += merged_users
+        stats.grants += merged_grants
+        stats.errors += len(missing)
+        for line_number, project_name in missing:
+            await on_error(line_number,
+                           f'project-not-found: {project_name}')
+
+
+async def split_lines(chunks: AsyncIterable,
+                      max_line: int = MAX_LINE_BYTES):
+    """
+    Строки из потока кусков байт (тела HTTP-запроса). Слишком длинная
+    строка не накапливается в памяти: вместо неё отдаётся None, а её
+    остаток до перевода строки пропускается.
+    """
+    buffer = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            if end == -1:
+                break
+            if oversized or len(buffer) + end - start > max_line:
+                yield None
+            else:
+                buffer += chunk[start:end + 1]
+                yield bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = end + 1
+        if not oversized:
+            buffer += chunk[start:]
+            if len(buffer) > max_line:
+                buffer.clear()
+                oversized = True
+    if oversized:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+
+async def read_lines(path: str):
+    """Строки файла без блокировки event loop на чтении всего файла."""
+    file = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        while True:
+            chunk = await asyncio.to_thread(file.readlines, 1 << 20)
+            if not chunk:
+                return
+            for line in chunk:
+                yield line
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+
+
+async def main(args) -> int:
+    errors = sys.stdout if args.errors == '-' else \
+        open(args.errors, 'w', encoding='utf-8')
+
+    async def on_error(line_number: int, message: str) -> None:
+        errors.write(json.dumps({'line': line_number, 'error': message},
+                                ensure_ascii=False) + '\n')
+
+    async def on_progress(stats: ImportStats) -> None:
+        print(f'lines={stats.lines} users={stats.users} '
+              f'grants={stats.grants} errors={stats.errors}',
+              file=sys.stderr)
+
+    db_manager = DBManager()
+    try:
+        stats = await UserImporter(db_manager, args.batch_size).run(
+            read_lines(args.path), on_error, on_progress)
+    finally:
+        await db_manager.dispose()
+        if errors is not sys.stdout:
+            errors.close()
+    return 1 if stats.errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help="JSONL file, '-' for stdin")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--errors', default='-',
+                        help="where to write per-record errors as JSONL")
+    sys.exit(asyncio.run(main(parser.parse_args())))
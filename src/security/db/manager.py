@@ -1,158 +1,570 @@
-from sqlalchemy import select, insert, delete, update
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from math import exp
+from time import perf_counter, monotonic
+from sqlalchemy.ext.asyncio import create_async_engine
 import logging
-from security.db.schema import Project, User, UserAccess
-from security.api.config import DB_CONNECTION_STR
-from asyncpg.exceptions import PostgresError
+from security.api.metrics import DB_QUERY_SECONDS, DB_POOL_WAIT_SECONDS
+from security.api.tracing import span
+from security.db import queries
+from security.db.rights import RightsCache, InvalidationListener
+from security.api.config import DB_CONNECTION_STR, DB_POOL_SIZE, \
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+    DB_POOL_WARM_UP, \
+    DB_QUERY_CACHE_SIZE, DB_PREPARED_STATEMENT_CACHE_SIZE, \
+    RIGHTS_CACHE_TTL, RIGHTS_CACHE_SIZE, RIGHTS_CHANNEL
 import asyncio
 import itertools
+import json
+import asyncpg
+
+current_unit = ContextVar('current_unit', default=None)
+
+
+def is_read_only(statement) -> bool:
+    return getattr(statement, 'is_select', False)
+
+
+class UnitOfWork:
+    """
+    Одно соединение на HTTP-запрос. Соединение берётся из пула при первом
+    запросе к БД и держится до конца запроса, поэтому обработчики ходят
+    во внешние сервисы (identity provider) до первого запроса. Чтения не
+    коммитятся, записи копятся в одной транзакции и фиксируются при
+    закрытии. Ошибка запроса откатывает транзакцию целиком.
+    """
+
+    def __init__(self, engine, on_connect=None):
+        self.engine = engine
+        self.on_connect = on_connect
+        self.connection = None
+        self.has_writes = False
+
+    async def connect(self):
+        if self.connection is None:
+            started = perf_counter()
+            self.connection = await self.engine.connect()
+            if self.on_connect is not None:
+                self.on_connect(perf_counter() - started)
+        return self.connection
+
+    async def execute(self, statement, parameters=None):
+        await self.connect()
+        if not is_read_only(statement):
+            self.has_writes = True
+        try:
+            return await self.connection.execute(statement, parameters)
+        except Exception:
+            await self.connection.rollback()
+            self.has_writes = False
+            raise
+
+    async def close(self, commit: bool) -> None:
+        if self.connection is None:
+            return
+        try:
+            if commit and self.has_writes:
+                with span('db.commit'):
+                    await self.connection.commit()
+            else:
+                await self.connection.rollback()
+        finally:
+            await self.connection.close()
+            self.connection = None
+            self.has_writes = False
 
 
 class DBExecution:
     """
     Класс хранящий в себе единственный на проект sqlalchemy engine,
     которому осуществяют доступ остальные классы, работающие с БД.
+    Engine создаётся при первом обращении, то есть уже в рабочем процессе
+    и его event loop, а не при сборке приложения.
     """
     __instance = None
 
+    # за сколько секунд затухает среднее время ожидания соединения
+    POOL_WAIT_DECAY = 5.0
+
     def __init__(self):
-        self.engine = create_async_engine(DB_CONNECTION_STR)
-        self.session = AsyncSession(self.engine, future=True)
+        self._engine = None
+        # DSN для прямых соединений asyncpg, минуя sqlalchemy
+        self.dsn = DB_CONNECTION_STR.replace('+asyncpg', '', 1)
+        self._pool_wait = 0.0
+        self._pool_wait_at = monotonic()
         self.logger = logging.Logger('db_access')
+        # пул прогрет: до этого /ping_db сообщает о неготовности
+        self.warm = False
 
-    async def execute(self, statement):
-        session = AsyncSession(self.engine, future=True)
-        async with session.begin():
-            try:
-                result = await session.execute(statement)
-            except PostgresError as err:
-                await session.rollback()
-                raise err
-            else:
-                await session.commit()
-                return result
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = self._create_engine()
+        return self._engine
+
+    @staticmethod
+    def _create_engine():
+        return create_async_engine(
+            DB_CONNECTION_STR,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            query_cache_size=DB_QUERY_CACHE_SIZE,
+            connect_args={
+                'prepared_statement_cache_size':
+                    DB_PREPARED_STATEMENT_CACHE_SIZE
+            }
+        )
+
+    async def warm_up(self, connections: int = DB_POOL_WARM_UP) -> None:
+        """
+        Открывает connections соединений одновременно и возвращает их
+        в пул, чтобы первые запросы не ждали подключения к Postgres.
+        При успехе выставляет warm.
+        """
+        async def connect():
+            return await self.engine.connect()
+
+        results = await asyncio.gather(
+            *(connect() for _ in range(min(connections, DB_POOL_SIZE))),
+            return_exceptions=True)
+        opened = [conn for conn in results
+                  if not isinstance(conn, BaseException)]
+        try:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            await asyncio.gather(
+                *(conn.execute(queries.PING_DB) for conn in opened))
+            self.warm = True
+        finally:
+            for conn in opened:
+                await conn.close()
+
+    async def ping(self) -> None:
+        await self.execute(queries.PING_DB)
+
+    async def dispose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        DB_POOL_WAIT_SECONDS.observe(seconds)
+        self._pool_wait = self.recent_pool_wait() * 0.8 + seconds * 0.2
+        self._pool_wait_at = monotonic()
+
+    def recent_pool_wait(self) -> float:
+        """Скользящее среднее ожидания соединения из пула, секунды.
+        Без новых замеров затухает, чтобы не блокировать запросы вечно."""
+        idle = monotonic() - self._pool_wait_at
+        return self._pool_wait * exp(-idle / self.POOL_WAIT_DECAY)
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        unit = UnitOfWork(self.engine, self.observe_pool_wait)
+        token = current_unit.set(unit)
+        commit = False
+        try:
+            yield unit
+            commit = True
+        finally:
+            current_unit.reset(token)
+            await unit.close(commit)
+
+    async def execute(self, statement, parameters=None):
+        name = queries.query_name(statement)
+        started = perf_counter()
+        try:
+            with span('db.' + name):
+                return await self._execute(statement, parameters)
+        finally:
+            DB_QUERY_SECONDS.labels(name).observe(perf_counter() - started)
+
+    async def _execute(self, statement, parameters=None):
+        unit = current_unit.get()
+        if unit is not None:
+            return await unit.execute(statement, parameters)
+
+        # вне HTTP-запроса (скрипты, бенчмарки) - отдельное соединение
+        if is_read_only(statement):
+            async with self.engine.connect() as conn:
+                return await conn.execute(statement, parameters)
+        async with self.engine.begin() as conn:
+            return await conn.execute(statement, parameters)
+
+    def pool_state(self) -> dict:
+        if self._engine is None:
+            return {'size': 0, 'checked_out': 0, 'checked_in': 0,
+                    'overflow': 0}
+        pool = self._engine.sync_engine.pool
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        }
+
+    async def stream(self, statement, parameters=None,
+                     chunk_size: int = 1000):
+        """Построчно отдаёт результат через серверный курсор."""
+        unit = current_unit.get()
+        if unit is not None:
+            rows = self._stream(await unit.connect(), statement, parameters,
+                                chunk_size)
+            async for row in rows:
+                yield row
+            return
+
+        async with self.engine.connect() as conn:
+            async for row in self._stream(conn, statement, parameters,
+                                          chunk_size):
+                yield row
+
+    @asynccontextmanager
+    async def raw_connection(self):
+        """
+        Отдельное соединение asyncpg для долгих операций, которых нет
+        в sqlalchemy (COPY). Не занимает место в пуле и не зависит от
+        его транзакций; транзакциями управляет вызывающий.
+        """
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+    @staticmethod
+    async def _stream(conn, statement, parameters, chunk_size: int):
+        result = await conn.stream(
+            statement.execution_options(yield_per=chunk_size), parameters)
+        try:
+            async for partition in result.partitions(chunk_size):
+                for row in partition:
+                    yield row
+        finally:
+            await result.close()
 
 
 class DBManager(DBExecution):
+    # полезная нагрузка NOTIFY ограничена 8000 байт
+    NOTIFY_MAX_IDS = 500
+    NOTIFY_MAX_BYTES = 8000
+
+    def __init__(self):
+        super().__init__()
+        self.rights_cache = RightsCache(ttl=RIGHTS_CACHE_TTL,
+                                        max_size=RIGHTS_CACHE_SIZE)
+        self.rights_listener = InvalidationListener(
+            dsn=self.dsn,
+            channel=RIGHTS_CHANNEL,
+            cache=self.rights_cache
+        )
+
+    async def publish_invalidation(self, changes: list = None,
+                                   **message) -> None:
+        """
+        Удаляет затронутые записи из своего кэша прав сразу, а из кэшей
+        остальных процессов - по уведомлению, которое Postgres доставит
+        после фиксации транзакции.
+
+        changes - изменения эффективных прав (строки refresh_effective),
+        по ним все процессы, включая этот, обновляют матрицу доступа.
+        Если они не помещаются в уведомление, передаётся None, и матрица
+        перечитывается целиком.
+        """
+        self.rights_cache.apply(message)
+        if changes is not None:
+            message['changes'] = [list(row) for row in changes]
+        payload = json.dumps(message)
+        if len(payload.encode()) > self.NOTIFY_MAX_BYTES:
+            message['changes'] = None
+            payload = json.dumps(message)
+        await self.execute(
+            queries.RIGHTS_NOTIFY,
+            {'channel': RIGHTS_CHANNEL, 'payload': payload})
+
+    async def publish_changes(self, changes: list) -> None:
+        """
+        Инвалидация по результату пересчёта эффективных прав: по проектам
+        или по пользователям, смотря чего меньше.
+        """
+        if not changes:
+            return
+        user_ids = sorted({row.user_id for row in changes})
+        project_ids = sorted({row.project_id for row in changes})
+        if len(project_ids) == 1:
+            await self.publish_invalidation(changes, project_id=project_ids[0])
+        elif min(len(user_ids), len(project_ids)) > self.NOTIFY_MAX_IDS:
+            await self.publish_invalidation(all=True)
+        elif len(project_ids) <= len(user_ids):
+            await self.publish_invalidation(changes, project_ids=project_ids)
+        else:
+            await self.publish_invalidation(changes, user_ids=user_ids)
+
+    async def refresh_effective(self, lock, refresh,
+                                parameters: dict) -> list:
+        """
+        Пересчитывает effective_accesses для пар, выбранных вариантом
+        запросов из queries (EFFECTIVE_LOCK*, EFFECTIVE_REFRESH*).
+        Возвращает изменившиеся строки (user_id, project_id, read, write,
+        grant), у удалённых права None.
+        """
+        if current_unit.get() is None:
+            # блокировки и пересчёт должны быть в одной транзакции
+            async with self.unit_of_work():
+                return await self.refresh_effective(lock, refresh,
+                                                    parameters)
+        await self.execute(lock, parameters)
+        returning_value = await self.execute(refresh, parameters)
+        return returning_value.fetchall()
+
+    async def refresh_pairs(self, pairs: list) -> list:
+        """Пересчёт эффективных прав пар (user_id, project_id)."""
+        return await self.refresh_effective(
+            queries.EFFECTIVE_LOCK, queries.EFFECTIVE_REFRESH,
+            {'user_ids': [user_id for user_id, _ in pairs],
+             'project_ids': [project_id for _, project_id in pairs]})
+
     async def user_create(self, yandex_id: str, is_admin: bool):
-        query = insert(User) \
-            .values(yoauth_uid=yandex_id, is_admin=is_admin) \
-            .returning(User.id)
-        returning_value = await self.execute(query)
+        returning_value = await self.execute(
+            queries.USER_CREATE,
+            {'yandex_id': yandex_id, 'is_admin': is_admin})
         parsed_value = returning_value.fetchone()
+        await self.publish_invalidation(user_id=parsed_value[0])
         return parsed_value[0]
 
     async def project_create(self, project_name: str) -> bool:
-        query = insert(Project) \
-            .values(name=project_name) \
-            .returning(Project.id)
-        returning_value = await self.execute(query)
+        returning_value = await self.execute(
+            queries.PROJECT_CREATE, {'project_name': project_name})
         parsed_value = returning_value.fetchone()
 
+        if parsed_value:
+            # в кэше могли остаться ответы "проекта нет" для этого имени
+            await self.publish_invalidation(project_id=parsed_value[0],
+                                            project_name=project_name)
         return parsed_value[0] if parsed_value else None
 
-    async def access_create(self, project_id: int, user_id: int) -> None:
-        query = insert(UserAccess) \
-            .values(project_id=project_id, user_id=user_id)
-        await self.execute(query)
-
-    async def project_get_id(self, user_id: int, project_name: str):
-        query = select(Project.id) \
-            .join(UserAccess) \
-            .where(Project.name == project_name,
-                   UserAccess.user_id == user_id) \
-            .limit(1)
-        returning_value = await self.execute(query)
-        parsed_value = returning_value.fetchone()
-        return parsed_value[0] if parsed_value else None
+    async def access_create(self, project_id: int, user_id: int,
+                            write: bool = True, read: bool = True,
+                            grant: bool = True) -> list:
+        await self.execute(
+            queries.ACCESS_CREATE,
+            {'project_id': project_id, 'user_id': user_id,
+             'write': write, 'read': read, 'grant': grant})
+        changes = await self.refresh_pairs([(user_id, project_id)])
+        await self.publish_invalidation(changes, project_id=project_id)
+        return changes
 
-    async def project_get_id_by_name(self, project_name: str):
-        query = select(Project.id) \
-            .where(Project.name == project_name) \
-            .limit(1)
-        returning_value = await self.execute(query)
-        parsed_value = returning_value.fetchone()
-        return parsed_value[0] if parsed_value else None
+    async def access_get(self, project_name: str, user_id: int = None,
+                         yandex_id: str = None):
+        """
+        Решение о доступе пользователя к проекту за один запрос.
 
-    async def user_get_id(self, yandex_id: str):
-        query = select(User.id).where(User.yoauth_uid == yandex_id)
-        returning_value = await self.execute(query)
-        parsed_value = returning_value.fetchone()
-        return parsed_value[0] if parsed_value is not None else None
+        Возвращает строку (user_id, is_admin, project_id, project_name,
+        read, write, grant, project_version, access_version) или None,
+        если пользователь не найден.
+        project_id равен None, если проекта нет, права равны None,
+        если у пользователя нет связи с проектом.
+        """
+        if yandex_id is not None:
+            returning_value = await self.execute(
+                queries.ACCESS_GET_BY_YANDEX_ID,
+                {'yandex_id': yandex_id, 'project_name': project_name})
+            return returning_value.fetchone()
 
-    async def user_get_role_by_yandex_id(self, yandex_id: str) -> bool:
-        query = select(User.is_admin).where(User.yoauth_uid == yandex_id)
-        returning_value = await self.execute(query)
-        parsed_value = returning_value.fetchone()
-        return parsed_value[0] if parsed_value is not None else None
+        key = (user_id, project_name)
+        found, row = self.rights_cache.get(key)
+        if found:
+            return row
+
+        generation = self.rights_cache.generation
+        returning_value = await self.execute(
+            queries.ACCESS_GET_BY_USER_ID,
+            {'user_id': user_id, 'project_name': project_name})
+        row = returning_value.fetchone()
+        self.rights_cache.put(key, row, generation)
+        return row
 
-    async def user_get_role_by_user_id(self, user_id: str) -> bool:
-        query = select(User.is_admin).where(User.id == user_id)
-        returning_value = await self.execute(query)
+    async def access_version(self, project_name: str, user_id: int):
+        """
+        Только версии проекта и прав пользователя на него: (is_admin,
+        project_id, project_version, access_version). Берутся из кэша
+        прав, если строка там есть.
+        """
+        found, row = self.rights_cache.get((user_id, project_name))
+        if not found:
+            returning_value = await self.execute(
+                queries.ACCESS_VERSION,
+                {'user_id': user_id, 'project_name': project_name})
+            row = returning_value.fetchone()
+        if row is None:
+            return None
+        return row.is_admin, row.project_id, row.project_version, \
+            row.access_version
+
+    async def user_get_principal(self, yandex_id: str):
+        returning_value = await self.execute(
+            queries.USER_GET_PRINCIPAL, {'yandex_id': yandex_id})
         parsed_value = returning_value.fetchone()
-        return parsed_value[0] if parsed_value is not None else None
+        return tuple(parsed_value) if parsed_value is not None else None
 
-    async def user_has_project(self, user_id: int, project_name: str) -> bool:
-        return bool(await self.user_get_project(user_id, project_name))
+    async def project_rename(self, project_id: int, new_name: str):
+        await self.execute(
+            queries.PROJECT_RENAME,
+            {'project_id': project_id, 'new_name': new_name})
+        await self.publish_invalidation(project_id=project_id,
+                                        project_name=new_name)
+        return True
 
-    async def user_get_project(self, user_id, project_name: str) -> tuple:
-        query = select(Project.name) \
-            .join(UserAccess) \
-            .filter(UserAccess.project_id == Project.id,
-                    UserAccess.user_id == user_id,
-                    Project.name == project_name)
+    def project_stream(self):
+        return self.stream(queries.PROJECT_STREAM)
 
-        returning_value = await self.execute(query)
-        parsed_value = returning_value.fetchone()
+    def access_stream(self):
+        return self.stream(queries.ACCESS_STREAM)
 
-        return parsed_value[0] if parsed_value else None
+    async def user_get_many(self, user_ids: list, yandex_ids: list) -> list:
+        """Пользователи, найденные по id или yandex id:
+        (user_id, yoauth_uid, is_admin)."""
+        returning_value = await self.execute(
+            queries.USER_GET_MANY,
+            {'user_ids': user_ids, 'yandex_ids': yandex_ids})
+        return returning_value.fetchall()
+
+    async def access_upsert(self, user_id: int, project_id: int,
+                            write: bool, read: bool, grant: bool) -> list:
+        """Создаёт связь пользователя с проектом или обновляет права
+        существующей одним запросом. Возвращает изменения эффективных
+        прав, как refresh_effective."""
+        await self.execute(
+            queries.ACCESS_UPSERT,
+            {'user_id': user_id, 'project_id': project_id,
+             'write': write, 'read': read, 'grant': grant})
+        changes = await self.refresh_pairs([(user_id, project_id)])
+        await self.publish_invalidation(changes, project_id=project_id)
+        return changes
+
+    async def access_set_many(self, project_id: int, rights: list) -> list:
+        """
+        Выдаёт права нескольким пользователям одним пакетным upsert
+        в транзакции текущего запроса.
+        rights — список (user_id, read, write, grant).
+        Возвращает изменения эффективных прав, как refresh_effective.
+        """
+        await self.execute(
+            queries.ACCESS_UPSERT,
+            [{'project_id': project_id, 'user_id': user_id,
+              'read': read, 'write': write, 'grant': grant}
+             for user_id, read, write, grant in rights]
+        )
+        changes = await self.refresh_pairs(
+            [(user_id, project_id) for user_id, *_ in rights])
+        await self.publish_invalidation(changes, project_id=project_id)
+        return changes
+
+    def project_list(self, user_id: int, is_admin: bool, after: int,
+                     limit: int):
+        """
+        Проекты пользователя с правами, упорядоченные по id, начиная
+        после after. Администратор видит все проекты.
+        """
+        query = queries.PROJECT_LIST_ALL if is_admin \
+            else queries.PROJECT_LIST_FOR_USER
+        return self.stream(query, {'user_id': user_id, 'after': after,
+                                   'limit': limit})
 
-    async def user_get_project_info(self, user_id, project_name: str) -> tuple:
-        query = select(Project.name, UserAccess.grant, UserAccess.write,
-                       UserAccess.read) \
-            .join(UserAccess) \
-            .filter(UserAccess.project_id == Project.id,
-                    UserAccess.user_id == user_id,
-                    Project.name == project_name)
+    async def group_create(self, group_name: str):
+        returning_value = await self.execute(
+            queries.GROUP_CREATE, {'group_name': group_name})
+        parsed_value = returning_value.fetchone()
+        return parsed_value[0] if parsed_value else None
 
-        returning_value = await self.execute(query)
+    async def group_get_id(self, group_name: str):
+        returning_value = await self.execute(
+            queries.GROUP_GET_ID, {'group_name': group_name})
         parsed_value = returning_value.fetchone()
+        return parsed_value[0] if parsed_value else None
 
-        return parsed_value
+    async def group_delete(self, group_id: int) -> list:
+        """
+        Удаляет группу. Сначала отзываются её права, чтобы пересчитать
+        эффективные права участников, пока состав группы известен.
+        """
+        await self.execute(queries.GROUP_LOCK, {'group_id': group_id})
+        returning_value = await self.execute(
+            queries.GROUP_ACCESS_DELETE_ALL, {'group_id': group_id})
+        project_ids = [row[0] for row in returning_value.fetchall()]
+        changes = await self._refresh_group_projects(group_id, project_ids)
+        await self.execute(queries.GROUP_DELETE, {'group_id': group_id})
+        return changes
 
-    async def project_update_name(self, user_id: int, project_name: str,
-                                  new_name: str):
-        project_id = await self.project_get_id(user_id, project_name)
-        if project_id is None:
-            return False
-        query = update(Project) \
-            .where(Project.id == project_id) \
-            .values(name=new_name)
+    async def group_add_members(self, group_id: int,
+                                user_ids: list) -> tuple:
+        """
+        Добавляет пользователей в группу; несуществующие пропускаются.
+        Возвращает (добавленные user_id, изменения эффективных прав).
+        """
+        await self.execute(queries.GROUP_LOCK, {'group_id': group_id})
+        returning_value = await self.execute(
+            queries.GROUP_ADD_MEMBERS,
+            {'group_id': group_id, 'user_ids': user_ids})
+        added = [row[0] for row in returning_value.fetchall()]
+        changes = await self._refresh_members(group_id, added)
+        return added, changes
 
-        await self.execute(query)
-        return True
+    async def group_remove_members(self, group_id: int,
+                                   user_ids: list) -> tuple:
+        """Возвращает (удалённые из группы user_id, изменения эффективных
+        прав)."""
+        await self.execute(queries.GROUP_LOCK, {'group_id': group_id})
+        returning_value = await self.execute(
+            queries.GROUP_REMOVE_MEMBERS,
+            {'group_id': group_id, 'user_ids': user_ids})
+        removed = [row[0] for row in returning_value.fetchall()]
+        changes = await self._refresh_members(group_id, removed)
+        return removed, changes
 
-    async def project_update_name_by_name(self,
-                                          project_name: str,
-                                          new_name: str):
-        project_id = await self.project_get_id_by_name(project_name)
-        if project_id is None:
-            return False
-        query = update(Project) \
-            .where(Project.id == project_id) \
-            .values(name=new_name)
-
-        await self.execute(query)
-        return True
+    async def _refresh_members(self, group_id: int, user_ids: list) -> list:
+        if not user_ids:
+            return []
+        changes = await self.refresh_effective(
+            queries.EFFECTIVE_LOCK_GROUP_MEMBERS,
+            queries.EFFECTIVE_REFRESH_GROUP_MEMBERS,
+            {'group_id': group_id, 'user_ids': user_ids})
+        await self.publish_changes(changes)
+        return changes
 
-    async def project_update_rights(self, user_id: int, project_id: int,
-                                    write: bool, read: bool, grant: bool):
-        if project_id is None:
-            return False
-        query = update(UserAccess) \
-            .where(UserAccess.project_id == project_id,
-                   UserAccess.user_id == user_id) \
-            .values(write=write, read=read, grant=grant)
+    async def group_access_set(self, group_id: int, project_id: int,
+                               read: bool, write: bool, grant: bool) -> list:
+        """Выдаёт или меняет права группы на проект. Возвращает изменения
+        эффективных прав участников."""
+        await self.execute(queries.GROUP_LOCK, {'group_id': group_id})
+        await self.execute(
+            queries.GROUP_ACCESS_UPSERT,
+            {'group_id': group_id, 'project_id': project_id,
+             'read': read, 'write': write, 'grant': grant})
+        return await self._refresh_group_projects(group_id, [project_id])
 
-        await self.execute(query)
-        return True
+    async def group_access_delete(self, group_id: int,
+                                  project_id: int) -> list:
+        """Отзывает права группы на проект. None, если их не было."""
+        await self.execute(queries.GROUP_LOCK, {'group_id': group_id})
+        returning_value = await self.execute(
+            queries.GROUP_ACCESS_DELETE,
+            {'group_id': group_id, 'project_id': project_id})
+        if returning_value.fetchone() is None:
+            return None
+        return await self._refresh_group_projects(group_id, [project_id])
+
+    async def _refresh_group_projects(self, group_id: int,
+                                      project_ids: list) -> list:
+        if not project_ids:
+            return []
+        changes = await self.refresh_effective(
+            queries.EFFECTIVE_LOCK_GROUP_PROJECTS,
+            queries.EFFECTIVE_REFRESH_GROUP_PROJECTS,
+            {'group_id': group_id, 'project_ids': project_ids})
+        await self.publish_changes(changes)
+        return changes
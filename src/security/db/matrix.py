@@ -0,0 +1,212 @@
+import asyncio
+from typing import Iterator, Optional, Tuple
+
+READ = 1
+WRITE = 2
+GRANT = 4
+# ячейка соответствует строке в effective_accesses (права могут быть
+# все False)
+LINKED = 8
+
+CELL_BITS = 4
+CELL_MASK = (1 << CELL_BITS) - 1
+
+
+def pack_rights(read: bool, write: bool, grant: bool) -> int:
+    return LINKED | (READ if read else 0) | (WRITE if write else 0) | \
+        (GRANT if grant else 0)
+
+
+class AccessMatrix:
+    """
+    Матрица доступа пользователь x проект в памяти процесса.
+
+    Каждая ячейка занимает полбайта: три бита прав и бит наличия связи.
+    Строки матрицы — bytearray на пользователя, выделяются только для
+    пользователей, у которых есть хотя бы одна связь с проектом. Столбцы
+    нумеруются в порядке добавления проектов.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = asyncio.Lock()
+        self._pending = None
+        self._stale = False
+        self._rows = {}
+        self._columns = {}
+        self._project_ids = []
+        self._project_names = []
+        self._by_name = {}
+
+    def clear(self) -> None:
+        self.loaded = False
+        self._rows.clear()
+        self._columns.clear()
+        self._project_ids.clear()
+        self._project_names.clear()
+        self._by_name.clear()
+
+    def invalidate(self) -> None:
+        """
+        Права изменились в другом процессе, а какие именно - неизвестно:
+        матрица перечитывается при следующем обращении.
+        """
+        self.loaded = False
+        if self._pending is not None:
+            self._stale = True
+
+    async def ensure_loaded(self, db_manager) -> None:
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            await self.load(db_manager)
+
+    async def load(self, db_manager) -> None:
+        self.clear()
+        # изменения, пришедшие во время загрузки, применяются поверх неё
+        self._pending = []
+        self._stale = False
+        try:
+            async for project_id, name in db_manager.project_stream():
+                self._add_project(project_id, name)
+            async for user_id, project_id, read, write, grant \
+                    in db_manager.access_stream():
+                self._set_rights(user_id, project_id, read, write, grant)
+            for method, args in self._pending:
+                method(*args)
+            # изменение из другого процесса могло не попасть в прочитанное
+            self.loaded = not self._stale
+        finally:
+            self._pending = None
+
+    def add_project(self, project_id: int, name: str) -> None:
+        if self._pending is not None:
+            self._pending.append((self._add_project, (project_id, name)))
+        self._add_project(project_id, name)
+
+    def rename_project(self, project_id: int, new_name: str) -> None:
+        if self._pending is not None:
+            self._pending.append((self._rename_project,
+                                  (project_id, new_name)))
+        self._rename_project(project_id, new_name)
+
+    def set_rights(self, user_id: int, project_id: int,
+                   read: bool, write: bool, grant: bool) -> None:
+        if self._pending is not None:
+            self._pending.append((self._set_rights,
+                                  (user_id, project_id, read, write, grant)))
+        self._set_rights(user_id, project_id, read, write, grant)
+
+    def apply_changes(self, changes) -> None:
+        """
+        Применяет строки (user_id, project_id, read, write, grant),
+        возвращённые пересчётом эффективных прав; права None - связи
+        больше нет.
+        """
+        for user_id, project_id, read, write, grant in changes:
+            if read is None:
+                self.remove_rights(user_id, project_id)
+            else:
+                self.set_rights(user_id, project_id, read, write, grant)
+
+    def remove_rights(self, user_id: int, project_id: int) -> None:
+        if self._pending is not None:
+            self._pending.append((self._remove_rights, (user_id, project_id)))
+        self._remove_rights(user_id, project_id)
+
+    def _add_project(self, project_id: int, name: str) -> int:
+        column = self._columns.get(project_id)
+        if column is not None:
+            self._rename_project(project_id, name)
+            return column
+        column = len(self._project_ids)
+        self._columns[project_id] = column
+        self._project_ids.append(project_id)
+        self._project_names.append(name)
+        self._by_name[name] = project_id
+        return column
+
+    def _rename_project(self, project_id: int, new_name: str) -> None:
+        column = self._columns.get(project_id)
+        if column is None:
+            return
+        self._by_name.pop(self._project_names[column], None)
+        self._project_names[column] = new_name
+        self._by_name[new_name] = project_id
+
+    def project_id(self, name: str) -> Optional[int]:
+        return self._by_name.get(name)
+
+    def _set_rights(self, user_id: int, project_id: int,
+                    read: bool, write: bool, grant: bool) -> None:
+        column = self._columns.get(project_id)
+        if column is None:
+            # проект появился в другом процессе, имени у нас ещё нет
+            column = self._add_project(project_id, str(project_id))
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self._rows[user_id] = bytearray()
+        index, shift = divmod(column, 2)
+        if index >= len(row):
+            row.extend(bytes(index + 1 - len(row)))
+        shift *= CELL_BITS
+        row[index] = (row[index] & ~(CELL_MASK << shift) & 0xFF) | \
+            (pack_rights(read, write, grant) << shift)
+
+    def _remove_rights(self, user_id: int, project_id: int) -> None:
+        row = self._rows.get(user_id)
+        column = self._columns.get(project_id)
+        if row is None or column is None:
+            return
+        index, shift = divmod(column, 2)
+        if index < len(row):
+            row[index] &= ~(CELL_MASK << shift * CELL_BITS) & 0xFF
+
+    def get_cell(self, user_id: int, project_id: int) -> int:
+        row = self._rows.get(user_id)
+        column = self._columns.get(project_id)
+        if row is None or column is None:
+            return 0
+        index, shift = divmod(column, 2)
+        if index >= len(row):
+            return 0
+        return (row[index] >> shift * CELL_BITS) & CELL_MASK
+
+    @staticmethod
+    def _row_cells(row: bytearray) -> Iterator[Tuple[int, int]]:
+        for index, byte in enumerate(row):
+            if not byte:
+                continue
+            if byte & CELL_MASK:
+                yield index * 2, byte & CELL_MASK
+            if byte >> CELL_BITS:
+                yield index * 2 + 1, byte >> CELL_BITS
+
+    def iter_cells(self, user_id: int = None, project_id: int = None
+                   ) -> Iterator[Tuple[int, int, str, int]]:
+        """
+        Перебирает непустые ячейки как (user_id, project_id, project_name,
+        cell). Можно ограничить перебор одним пользователем или проектом.
+        """
+        if user_id is not None:
+            rows = ((user_id, self._rows.get(user_id) or bytearray()),)
+        else:
+            rows = tuple(self._rows.items())
+
+        if project_id is not None:
+            if project_id not in self._columns:
+                return
+            for row_user_id, _ in rows:
+                cell = self.get_cell(row_user_id, project_id)
+                if cell:
+                    column = self._columns[project_id]
+                    yield row_user_id, project_id, \
+                        self._project_names[column], cell
+            return
+
+        for row_user_id, row in rows:
+            for column, cell in self._row_cells(row):
+                yield row_user_id, self._project_ids[column], \
+                    self._project_names[column], cell
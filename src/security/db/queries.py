@@ -0,0 +1,298 @@
+"""
+Неизменяемые запросы DBManager.
+
+Запросы собираются один раз при импорте и параметризуются через
+bindparam, поэтому на каждый вызов не тратится время на построение
+конструкции и вычисление ключа кэша компиляции sqlalchemy. Одинаковый
+SQL позволяет asyncpg переиспользовать подготовленные выражения
+на соединении.
+"""
+from sqlalchemy import select, insert, update, delete, and_, or_, \
+    bindparam, text, literal_column, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql.expression import Executable
+
+from security.db.schema import Project, User, UserAccess, Group, \
+    GroupMember, GroupAccess, EffectiveAccess
+
+_names = {}
+
+
+def query_name(statement) -> str:
+    """Имя запроса из этого модуля (например, access_get_by_user_id)
+    для трассировки; для остальных запросов - их тип."""
+    if not _names:
+        _names.update(
+            (id(value), name.lower()) for name, value in globals().items()
+            if isinstance(value, Executable) and not name.startswith('_')
+        )
+    name = _names.get(id(statement))
+    if name is None:
+        name = type(statement).__name__.lower()
+    return name
+
+
+PING_DB = select(literal_column('1'))
+
+USER_CREATE = insert(User) \
+    .values(yoauth_uid=bindparam('yandex_id'),
+            is_admin=bindparam('is_admin')) \
+    .returning(User.id)
+
+USER_GET_PRINCIPAL = select(User.id, User.is_admin) \
+    .where(User.yoauth_uid == bindparam('yandex_id'))
+
+USER_GET_MANY = select(User.id.label('user_id'), User.yoauth_uid,
+                       User.is_admin) \
+    .where(or_(User.id.in_(bindparam('user_ids', expanding=True)),
+               User.yoauth_uid.in_(bindparam('yandex_ids', expanding=True))))
+
+PROJECT_CREATE = insert(Project) \
+    .values(name=bindparam('project_name')) \
+    .returning(Project.id)
+
+PROJECT_RENAME = update(Project) \
+    .where(Project.id == bindparam('project_id')) \
+    .values(name=bindparam('new_name'), version=Project.version + 1)
+
+PROJECT_STREAM = select(Project.id, Project.name).order_by(Project.id)
+
+
+def _access_get(user_filter, columns=None):
+    # права с учётом групп уже собраны в effective_accesses,
+    # поэтому проверка остаётся одним поиском по индексу
+    if columns is None:
+        columns = (User.id.label('user_id'), User.is_admin,
+                   Project.id.label('project_id'),
+                   Project.name.label('project_name'),
+                   EffectiveAccess.read, EffectiveAccess.write,
+                   EffectiveAccess.grant,
+                   Project.version.label('project_version'),
+                   EffectiveAccess.version.label('access_version'))
+    return select(*columns) \
+        .select_from(User) \
+        .outerjoin(Project, Project.name == bindparam('project_name')) \
+        .outerjoin(EffectiveAccess,
+                   and_(EffectiveAccess.user_id == User.id,
+                        EffectiveAccess.project_id == Project.id)) \
+        .where(user_filter) \
+        .limit(1)
+
+
+ACCESS_GET_BY_USER_ID = _access_get(User.id == bindparam('user_id'))
+
+ACCESS_GET_BY_YANDEX_ID = _access_get(
+    User.yoauth_uid == bindparam('yandex_id'))
+
+# только то, от чего зависит ETag ответа GET /project/{project_name}
+ACCESS_VERSION = _access_get(
+    User.id == bindparam('user_id'),
+    (User.is_admin, Project.id.label('project_id'),
+     Project.version.label('project_version'),
+     EffectiveAccess.version.label('access_version')))
+
+ACCESS_CREATE = insert(UserAccess)
+
+_access_insert = pg_insert(UserAccess)
+ACCESS_UPSERT = _access_insert.on_conflict_do_update(
+    index_elements=[UserAccess.user_id, UserAccess.project_id],
+    set_={'read': _access_insert.excluded.read,
+          'write': _access_insert.excluded.write,
+          'grant': _access_insert.excluded.grant,
+          'version': UserAccess.version + 1}
+)
+
+ACCESS_STREAM = select(EffectiveAccess.user_id, EffectiveAccess.project_id,
+                       EffectiveAccess.read, EffectiveAccess.write,
+                       EffectiveAccess.grant)
+
+PROJECT_LIST_FOR_USER = select(Project.id, Project.name,
+                               EffectiveAccess.grant, EffectiveAccess.write,
+                               EffectiveAccess.read) \
+    .join(EffectiveAccess,
+          and_(EffectiveAccess.project_id == Project.id,
+               EffectiveAccess.user_id == bindparam('user_id'))) \
+    .where(Project.id > bindparam('after')) \
+    .order_by(Project.id) \
+    .limit(bindparam('limit'))
+
+PROJECT_LIST_ALL = select(Project.id, Project.name, EffectiveAccess.grant,
+                          EffectiveAccess.write, EffectiveAccess.read) \
+    .outerjoin(EffectiveAccess,
+               and_(EffectiveAccess.project_id == Project.id,
+                    EffectiveAccess.user_id == bindparam('user_id'))) \
+    .where(Project.id > bindparam('after')) \
+    .order_by(Project.id) \
+    .limit(bindparam('limit'))
+
+# текстовый запрос считается записью, поэтому вне запроса HTTP
+# уведомление фиксируется, а не откатывается вместе с чтением
+RIGHTS_NOTIFY = text('SELECT pg_notify(:channel, :payload)')
+
+GROUP_CREATE = pg_insert(Group) \
+    .values(name=bindparam('group_name')) \
+    .on_conflict_do_nothing(index_elements=[Group.name]) \
+    .returning(Group.id)
+
+GROUP_GET_ID = select(Group.id) \
+    .where(Group.name == bindparam('group_name'))
+
+GROUP_DELETE = delete(Group) \
+    .where(Group.id == bindparam('group_id'))
+
+# несуществующие пользователи и повторы пропускаются
+GROUP_ADD_MEMBERS = pg_insert(GroupMember) \
+    .from_select(
+        ['group_id', 'user_id'],
+        select(bindparam('group_id', type_=Integer), User.id)
+        .where(User.id.in_(bindparam('user_ids', expanding=True)))) \
+    .on_conflict_do_nothing() \
+    .returning(GroupMember.user_id)
+
+GROUP_REMOVE_MEMBERS = delete(GroupMember) \
+    .where(GroupMember.group_id == bindparam('group_id'),
+           GroupMember.user_id.in_(bindparam('user_ids', expanding=True))) \
+    .returning(GroupMember.user_id)
+
+_group_access_insert = pg_insert(GroupAccess)
+GROUP_ACCESS_UPSERT = _group_access_insert.on_conflict_do_update(
+    index_elements=[GroupAccess.group_id, GroupAccess.project_id],
+    set_={'read': _group_access_insert.excluded.read,
+          'write': _group_access_insert.excluded.write,
+          'grant': _group_access_insert.excluded.grant}
+)
+
+GROUP_ACCESS_DELETE = delete(GroupAccess) \
+    .where(GroupAccess.group_id == bindparam('group_id'),
+           GroupAccess.project_id == bindparam('project_id')) \
+    .returning(GroupAccess.project_id)
+
+GROUP_ACCESS_DELETE_ALL = delete(GroupAccess) \
+    .where(GroupAccess.group_id == bindparam('group_id')) \
+    .returning(GroupAccess.project_id)
+
+
+# Пересчёт effective_accesses. Каждый вариант задаётся запросом,
+# возвращающим затронутые пары (user_id, project_id); для этих пар права
+# заново собираются из accesses и group_accesses групп пользователя.
+# Перед пересчётом берутся блокировки затронутых пользователей: пересчёт
+# идёт отдельным запросом с новым снимком и видит все изменения
+# транзакций, державших блокировку раньше, поэтому параллельные изменения
+# прямых и групповых прав одного пользователя не теряют друг друга.
+# Блокируется не каждый пользователь, а его корзина user_id %
+# EFFECTIVE_LOCK_BUCKETS: пачка импорта или выдача прав большой группе
+# занимает не больше EFFECTIVE_LOCK_BUCKETS мест в общей таблице
+# блокировок Postgres (max_locks_per_transaction на соединение).
+# Изменения группы сначала блокируют саму группу: иначе добавление
+# участника и выдача группе прав на проект не увидят друг друга при
+# выборе затронутых пар.
+
+EFFECTIVE_LOCK_SPACE = 25
+EFFECTIVE_LOCK_BUCKETS = 64
+GROUP_LOCK_SPACE = 26
+
+GROUP_LOCK = text(
+    f'SELECT pg_advisory_xact_lock({GROUP_LOCK_SPACE}, :group_id)')
+
+EFFECTIVE_PAIRS = """
+    SELECT user_id, project_id
+    FROM unnest(CAST(:user_ids AS integer[]),
+                CAST(:project_ids AS integer[])) AS t(user_id, project_id)
+"""
+
+# изменение прав группы на проекты: все участники группы
+EFFECTIVE_PAIRS_GROUP_PROJECTS = """
+    SELECT m.user_id, p.project_id
+    FROM group_members m
+    CROSS JOIN unnest(CAST(:project_ids AS integer[])) AS p(project_id)
+    WHERE m.group_id = :group_id
+"""
+
+# изменение состава группы: все проекты группы
+EFFECTIVE_PAIRS_GROUP_MEMBERS = """
+    SELECT u.user_id, ga.project_id
+    FROM unnest(CAST(:user_ids AS integer[])) AS u(user_id)
+    CROSS JOIN group_accesses ga
+    WHERE ga.group_id = :group_id
+"""
+
+
+def effective_lock_sql(pairs: str) -> str:
+    # порядок блокировок одинаков во всех транзакциях
+    return f"""
+    SELECT pg_advisory_xact_lock({EFFECTIVE_LOCK_SPACE}, bucket)
+    FROM (SELECT DISTINCT user_id % {EFFECTIVE_LOCK_BUCKETS} AS bucket
+          FROM ({pairs}) AS pairs
+          ORDER BY bucket) AS buckets
+    """
+
+
+def effective_refresh_sql(pairs: str) -> str:
+    """
+    Возвращает изменившиеся пары: (user_id, project_id, read, write,
+    grant), у удалённых права NULL. Версия берётся из общей
+    последовательности и меняется только вместе с правами.
+    """
+    return f"""
+    WITH pairs AS (
+        SELECT DISTINCT user_id, project_id FROM ({pairs}) AS pairs
+    ),
+    granted AS (
+        SELECT user_id, project_id, bool_or(read) AS read,
+               bool_or(write) AS write, bool_or("grant") AS "grant"
+        FROM (
+            SELECT a.user_id, a.project_id, a.read, a.write, a."grant"
+            FROM pairs p
+            JOIN accesses a
+              ON a.user_id = p.user_id AND a.project_id = p.project_id
+            UNION ALL
+            SELECT m.user_id, ga.project_id, ga.read, ga.write, ga."grant"
+            FROM pairs p
+            JOIN group_members m ON m.user_id = p.user_id
+            JOIN group_accesses ga
+              ON ga.group_id = m.group_id AND ga.project_id = p.project_id
+        ) AS sources
+        GROUP BY user_id, project_id
+    ),
+    removed AS (
+        DELETE FROM effective_accesses e
+        USING pairs p
+        WHERE e.user_id = p.user_id AND e.project_id = p.project_id
+          AND NOT EXISTS (SELECT 1 FROM granted g
+                          WHERE g.user_id = e.user_id
+                            AND g.project_id = e.project_id)
+        RETURNING e.user_id, e.project_id
+    ),
+    changed AS (
+        INSERT INTO effective_accesses
+            (user_id, project_id, read, write, "grant")
+        SELECT user_id, project_id, read, write, "grant" FROM granted
+        ON CONFLICT (user_id, project_id) DO UPDATE
+        SET read = excluded.read, write = excluded.write,
+            "grant" = excluded."grant",
+            version = nextval('effective_accesses_version_seq')
+        WHERE (effective_accesses.read, effective_accesses.write,
+               effective_accesses."grant")
+              IS DISTINCT FROM (excluded.read, excluded.write,
+                                excluded."grant")
+        RETURNING user_id, project_id, read, write, "grant"
+    )
+    SELECT user_id, project_id, read, write, "grant" FROM changed
+    UNION ALL
+    SELECT user_id, project_id, NULL::boolean, NULL::boolean, NULL::boolean
+    FROM removed
+    """
+
+
+EFFECTIVE_LOCK = text(effective_lock_sql(EFFECTIVE_PAIRS))
+EFFECTIVE_REFRESH = text(effective_refresh_sql(EFFECTIVE_PAIRS))
+
+EFFECTIVE_LOCK_GROUP_PROJECTS = text(
+    effective_lock_sql(EFFECTIVE_PAIRS_GROUP_PROJECTS))
+EFFECTIVE_REFRESH_GROUP_PROJECTS = text(
+    effective_refresh_sql(EFFECTIVE_PAIRS_GROUP_PROJECTS))
+
+EFFECTIVE_LOCK_GROUP_MEMBERS = text(
+    effective_lock_sql(EFFECTIVE_PAIRS_GROUP_MEMBERS))
+EFFECTIVE_REFRESH_GROUP_MEMBERS = text(
+    effective_refresh_sql(EFFECTIVE_PAIRS_GROUP_MEMBERS))
@@ -0,0 +1,218 @@
+"""
+Кэш решений о доступе с инвалидацией через Postgres LISTEN/NOTIFY.
+
+DBManager кэширует строки access_get по ключу (user_id, project_name).
+Каждая запись прав публикует уведомление в канал RIGHTS_CHANNEL в той же
+транзакции, поэтому остальные процессы и реплики получают его только
+после фиксации изменений и удаляют затронутые записи.
+
+Пока соединение-слушатель не установлено, кэш выключен: без
+уведомлений нельзя гарантировать, что записи актуальны. После
+переподключения кэш очищается, а подписчику on_message передаётся
+уведомление {'all': True}, так как часть уведомлений могла
+потеряться. TTL ограничивает устаревание, если уведомление всё же
+не дошло.
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict, defaultdict
+from time import monotonic
+from typing import Callable, Optional
+
+import asyncpg
+
+from security.api.metrics import RIGHTS_CACHE_REQUESTS, \
+    RIGHTS_CACHE_INVALIDATIONS
+
+logger = logging.getLogger('messenger-api')
+
+
+class RightsCache:
+    """
+    (user_id, project_name) -> строка access_get.
+
+    Вторичные индексы по пользователю, id и имени проекта позволяют
+    удалять все записи, затронутые одним изменением. Счётчик поколений
+    не даёт сохранить результат чтения, начатого до инвалидации.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = False
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._by_user = defaultdict(set)
+        self._by_project_id = defaultdict(set)
+        self._by_project_name = defaultdict(set)
+
+    def get(self, key: tuple):
+        """(найдено, строка)."""
+        if not self.enabled:
+            return False, None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                self._remove(key)
+            RIGHTS_CACHE_REQUESTS.labels('miss').inc()
+            return False, None
+        self._entries.move_to_end(key)
+        RIGHTS_CACHE_REQUESTS.labels('hit').inc()
+        return True, entry[1]
+
+    def put(self, key: tuple, row, generation: int) -> None:
+        if not self.enabled or generation != self.generation or \
+                self.ttl <= 0 or self.max_size <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (monotonic() + self.ttl, row)
+        user_id, project_name = key
+        self._by_user[user_id].add(key)
+        self._by_project_name[project_name].add(key)
+        if row is not None and row.project_id is not None:
+            self._by_project_id[row.project_id].add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: tuple) -> None:
+        _, row = self._entries.pop(key)
+        user_id, project_name = key
+        self._discard(self._by_user, user_id, key)
+        self._discard(self._by_project_name, project_name, key)
+        if row is not None and row.project_id is not None:
+            self._discard(self._by_project_id, row.project_id, key)
+
+    @staticmethod
+    def _discard(index: dict, value, key: tuple) -> None:
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def evict_user(self, user_id: int) -> None:
+        self.generation += 1
+        for key in list(self._by_user.get(user_id, ())):
+            self._remove(key)
+
+    def evict_project(self, project_id: int = None,
+                      project_name: str = None) -> None:
+        self.generation += 1
+        keys = set(self._by_project_id.get(project_id, ()))
+        keys.update(self._by_project_name.get(project_name, ()))
+        for key in keys:
+            self._remove(key)
+
+    def apply(self, message: dict) -> None:
+        """Применяет уведомление, опубликованное DBManager."""
+        RIGHTS_CACHE_INVALIDATIONS.inc()
+        if message.get('all'):
+            # массовые изменения (импорт) не описываются по отдельности
+            self.clear()
+        elif 'user_id' in message:
+            self.evict_user(message['user_id'])
+        elif 'user_ids' in message:
+            for user_id in message['user_ids']:
+                self.evict_user(user_id)
+        elif 'project_ids' in message:
+            for project_id in message['project_ids']:
+                self.evict_project(project_id)
+        else:
+            self.evict_project(message.get('project_id'),
+                               message.get('project_name'))
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._by_user.clear()
+        self._by_project_id.clear()
+        self._by_project_name.clear()
+
+
+class InvalidationListener:
+    """
+    Отдельное от пула соединение asyncpg, подписанное на канал
+    уведомлений. При обрыве переподключается с нарастающей паузой.
+    """
+    PING_INTERVAL = 30
+    PING_TIMEOUT = 5
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(self, dsn: str, channel: str, cache: RightsCache,
+                 on_message: Optional[Callable[[dict], None]] = None):
+        self.dsn = dsn
+        self.channel = channel
+        self.cache = cache
+        self.on_message = on_message
+        self._task = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.error('bad rights notification %r', payload)
+            message = {'all': True}
+        self._apply(message)
+
+    def _apply(self, message: dict) -> None:
+        self.cache.apply(message)
+        if self.on_message is not None:
+            self.on_message(message)
+
+    async def _run(self) -> None:
+        delay = 1
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+            except (OSError, asyncpg.PostgresError) as err:
+                logger.error('rights listener cannot connect error=%r', err)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+                continue
+
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            try:
+                await connection.add_listener(self.channel, self._notify)
+                # уведомления за время без соединения потеряны: всё, что
+                # строилось по ним, сбрасывается как после импорта
+                self.cache.enabled = True
+                self._apply({'all': True})
+                delay = 1
+                await self._watch(connection, lost)
+            except (OSError, asyncpg.PostgresError) as err:
+                logger.error('rights listener lost connection error=%r', err)
+            finally:
+                self.cache.enabled = False
+                self.cache.clear()
+                if not connection.is_closed():
+                    connection.terminate()
+
+    async def _watch(self, connection, lost: asyncio.Event) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(lost.wait(), self.PING_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+            # обрыв без закрытия сокета виден только по ответу сервера
+            try:
+                await connection.execute('SELECT 1',
+                                         timeout=self.PING_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
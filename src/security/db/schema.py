@@ -1,6 +1,6 @@
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, \
-    UniqueConstraint, Boolean
+    UniqueConstraint, Boolean, Index, BigInteger, Sequence
 
 Base = declarative_base()
 
@@ -14,11 +14,23 @@ class User(Base):
 
 class UserAccess(Base):
     __tablename__ = 'accesses'
+    __table_args__ = (
+        # уникальный ключ, он же покрывающий индекс для проверки прав
+        # пользователя без обращения к таблице (в миграциях - ограничение
+        # UNIQUE поверх этого индекса)
+        Index('accesses_user_id_project_id_key',
+              'user_id', 'project_id', unique=True,
+              postgresql_include=['read', 'write', 'grant']),
+        # срезы по проекту и каскадное удаление проектов
+        Index('ix_accesses_project_id_user_id', 'project_id', 'user_id'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
 
     read = Column(Boolean, default=True, nullable=False)
     write = Column(Boolean, default=True, nullable=False)
     grant = Column(Boolean, default=True, nullable=False)
+    # увеличивается при каждом изменении прав, используется в ETag
+    version = Column(Integer, default=1, server_default='1', nullable=False)
 
     user_id = Column(Integer,
                      ForeignKey('users.id', onupdate="CASCADE",
@@ -32,6 +44,87 @@ class Project(Base):
     __tablename__ = 'projects'
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, unique=True)
+    # увеличивается при переименовании, используется в ETag
+    version = Column(Integer, default=1, server_default='1', nullable=False)
 
     access_r = relationship("UserAccess", cascade="all,delete",
                             backref="projects")
+
+
+class Group(Base):
+    __tablename__ = 'groups'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class GroupMember(Base):
+    __tablename__ = 'group_members'
+    __table_args__ = (
+        # группы пользователя при пересчёте эффективных прав
+        Index('ix_group_members_user_id_group_id', 'user_id', 'group_id'),
+    )
+    group_id = Column(Integer,
+                      ForeignKey('groups.id', onupdate="CASCADE",
+                                 ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer,
+                     ForeignKey('users.id', onupdate="CASCADE",
+                                ondelete="CASCADE"), primary_key=True)
+
+
+class GroupAccess(Base):
+    __tablename__ = 'group_accesses'
+    __table_args__ = (
+        UniqueConstraint('group_id', 'project_id',
+                         name='group_accesses_group_id_project_id_key'),
+        Index('ix_group_accesses_project_id', 'project_id'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    read = Column(Boolean, default=False, nullable=False)
+    write = Column(Boolean, default=False, nullable=False)
+    grant = Column(Boolean, default=False, nullable=False)
+
+    group_id = Column(Integer,
+                      ForeignKey('groups.id', onupdate="CASCADE",
+                                 ondelete="CASCADE"), nullable=False)
+    project_id = Column(Integer,
+                        ForeignKey('projects.id', onupdate="CASCADE",
+                                   ondelete="CASCADE"), nullable=False)
+
+
+effective_version = Sequence('effective_accesses_version_seq')
+
+
+class EffectiveAccess(Base):
+    """
+    Итоговые права пользователя на проект: объединение (OR) прямых прав
+    из accesses и прав всех его групп. Строка есть, если есть хотя бы
+    один источник. Таблица пересчитывается DBManager для затронутых пар
+    в транзакции изменения, проверка прав читает только её.
+    """
+    __tablename__ = 'effective_accesses'
+    __table_args__ = (
+        # проверка прав пользователя без обращения к таблице
+        Index('ix_effective_accesses_user_id_project_id_rights',
+              'user_id', 'project_id', unique=True,
+              postgresql_include=['read', 'write', 'grant', 'version']),
+        Index('ix_effective_accesses_project_id_user_id',
+              'project_id', 'user_id'),
+    )
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+
+    read = Column(Boolean, nullable=False)
+    write = Column(Boolean, nullable=False)
+    grant = Column(Boolean, nullable=False)
+    # общая последовательность: после удаления и повторной выдачи
+    # версия не повторяется, поэтому старый ETag не совпадёт
+    version = Column(BigInteger, effective_version,
+                     server_default=effective_version.next_value(),
+                     nullable=False)
+
+    user_id = Column(Integer,
+                     ForeignKey('users.id', onupdate="CASCADE",
+                                ondelete="CASCADE"), nullable=False)
+    project_id = Column(Integer,
+                        ForeignKey('projects.id', onupdate="CASCADE",
+                                   ondelete="CASCADE"), nullable=False)
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+# пакет не устанавливается, код лежит в src
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from security.api.app import create_app  # noqa: E402
+from security.api.cache import Principal  # noqa: E402
+
+# строки, которые возвращает DBManager
+Access = namedtuple('Access', 'user_id is_admin project_id project_name '
+                              'read write grant project_version '
+                              'access_version')
+Target = namedtuple('Target', 'user_id yoauth_uid is_admin')
+Change = namedtuple('Change', 'user_id project_id read write grant')
+
+PROJECT_ID = 7
+
+
+class FakeDBManager:
+    """
+    Подмена DBManager без Postgres: методы, не переопределённые
+    в наследнике, берутся у настоящего менеджера.
+    """
+
+    def __init__(self, real):
+        self.real = real
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+class FakeIdentity:
+    """identity provider, знающий только переданные токены."""
+
+    def __init__(self, tokens: dict = None):
+        self.tokens = tokens or {}
+
+    async def get_yandex_id(self, token):
+        return self.tokens.get(token)
+
+
+def call_app(tmp_path, db_factory, method: str, path: str,
+             principal: Principal = Principal(1, False), identity=None,
+             **kwargs):
+    """
+    Один запрос к приложению без Postgres и identity provider.
+    db_factory получает настоящий DBManager и возвращает подмену.
+    Возвращает (status, headers, body, app).
+    """
+    async def run():
+        app = create_app(log_file=str(tmp_path / 'api_logs.txt'))
+        app.on_startup.clear()
+        app.on_cleanup.clear()
+        app['pg_db_manager'] = db_factory(app['pg_db_manager'])
+        if identity is not None:
+            app['identity_client'] = identity
+
+        async def get_principal(token, loader):
+            return principal
+        app['principal_cache'].get = get_principal
+
+        try:
+            async with TestClient(TestServer(app)) as client:
+                response = await client.request(
+                    method, path, headers={'Authorization': 'token',
+                                           **kwargs.pop('headers', {})},
+                    **kwargs)
+                body = await response.read()
+        finally:
+            app['log_manager'].stop()
+        return response.status, response.headers, body, app
+
+    return asyncio.run(run())
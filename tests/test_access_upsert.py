@@ -0,0 +1,77 @@
+import asyncio
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from conftest import Change
+from security.db.manager import DBManager
+from security.db.schema import Project, User, UserAccess
+
+
+class SqliteDBManager(DBManager):
+    """
+    DBManager на sqlite в памяти: upsert прав выполняется настоящим
+    запросом (ON CONFLICT есть и в sqlite), пересчёт эффективных прав
+    написан для Postgres и заменён отдачей заранее заданных изменений.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.notified = []
+        self.refreshed = []
+        self.changes = []
+
+    def _create_engine(self):
+        engine = create_async_engine('sqlite+aiosqlite://')
+
+        @event.listens_for(engine.sync_engine, 'connect')
+        def add_pg_notify(connection, record):
+            connection.create_function(
+                'pg_notify', 2,
+                lambda channel, payload: self.notified.append(payload))
+        return engine
+
+    async def refresh_pairs(self, pairs: list) -> list:
+        self.refreshed.append(pairs)
+        return self.changes
+
+
+async def upsert_twice():
+    db = SqliteDBManager()
+    async with db.unit_of_work() as unit:
+        connection = await unit.connect()
+        await connection.run_sync(lambda sync: [
+            table.__table__.create(sync)
+            for table in (User, Project, UserAccess)])
+        await connection.execute(User.__table__.insert(),
+                                 {'yoauth_uid': 'y1', 'is_admin': False})
+        await connection.execute(Project.__table__.insert(),
+                                 {'name': 'lavka'})
+
+        db.changes = [Change(1, 1, True, False, False)]
+        inserted = await db.access_upsert(1, 1, read=True, write=False,
+                                          grant=False)
+        first = (await unit.execute(select(UserAccess))).fetchall()
+
+        db.changes = [Change(1, 1, True, True, True)]
+        updated = await db.access_upsert(1, 1, read=True, write=True,
+                                         grant=True)
+        second = (await unit.execute(select(UserAccess))).fetchall()
+    await db.dispose()
+    return db, inserted, first, updated, second
+
+
+def test_access_upsert_inserts_then_updates_one_row():
+    db, inserted, first, updated, second = asyncio.run(upsert_twice())
+
+    assert [(row.user_id, row.project_id, row.read, row.write, row.grant,
+             row.version) for row in first] == [(1, 1, True, False, False, 1)]
+    # повторная выдача обновляет ту же строку и увеличивает версию
+    assert [(row.id, row.read, row.write, row.grant, row.version)
+            for row in second] == [(first[0].id, True, True, True, 2)]
+
+    # возвращаются изменения эффективных прав пересчитанной пары
+    assert db.refreshed == [[(1, 1)], [(1, 1)]]
+    assert inserted == [Change(1, 1, True, False, False)]
+    assert updated == [Change(1, 1, True, True, True)]
+    assert len(db.notified) == 2
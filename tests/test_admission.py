@@ -0,0 +1,36 @@
+import asyncio
+
+from security.api.admission import NORMAL, AdmissionController
+from security.api.errors import TooManyRequests
+
+
+def controller() -> AdmissionController:
+    return AdmissionController(max_in_flight=10, max_per_user=2,
+                               queue_size=0, queue_timeout=0.1,
+                               pool_wait_limit=1.0)
+
+
+def test_per_user_limit_applies_to_tokens():
+    async def run():
+        admission = controller()
+        assert await admission.acquire('token', NORMAL) is None
+        assert await admission.acquire('token', NORMAL) is None
+        assert await admission.acquire('token', NORMAL) is TooManyRequests
+        admission.release('token')
+        assert await admission.acquire('token', NORMAL) is None
+
+    asyncio.run(run())
+
+
+def test_requests_without_token_share_only_global_limit():
+    async def run():
+        admission = controller()
+        for _ in range(10):
+            assert await admission.acquire(None, NORMAL) is None
+        # общий лимит исчерпан, очереди нет
+        assert await admission.acquire(None, NORMAL) is not None
+        for _ in range(10):
+            admission.release(None)
+        assert admission.in_flight == 0
+
+    asyncio.run(run())
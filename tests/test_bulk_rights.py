@@ -0,0 +1,102 @@
+import json
+
+from conftest import Access, Change, FakeDBManager, FakeIdentity, \
+    PROJECT_ID, Target, call_app
+
+TOKENS = {'token-4': 'y4'}
+
+
+class FakeDB(FakeDBManager):
+    """Владелец проекта 1 с правами read+grant."""
+
+    def __init__(self, real):
+        super().__init__(real)
+        self.users = {2: Target(2, 'y2', False), 3: Target(3, 'y3', True),
+                      4: Target(4, 'y4', False)}
+        self.set_many = []
+
+    async def access_get(self, project_name, user_id=None, yandex_id=None):
+        return Access(user_id, False, PROJECT_ID, project_name,
+                      True, False, True, 1, 1)
+
+    async def user_get_many(self, user_ids, yandex_ids):
+        return [user for user in self.users.values()
+                if user.user_id in user_ids or user.yoauth_uid in yandex_ids]
+
+    async def access_set_many(self, project_id, rights):
+        self.set_many.append((project_id, rights))
+        return [Change(user_id, project_id, *flags)
+                for user_id, *flags in rights]
+
+
+def patch_rights(tmp_path, body):
+    status, _, payload, app = call_app(
+        tmp_path, FakeDB, 'PATCH', '/project/lavka/rights',
+        identity=FakeIdentity(TOKENS), json=body)
+    return status, json.loads(payload), app['pg_db_manager']
+
+
+def test_bulk_rights_reports_each_target(tmp_path):
+    status, payload, db = patch_rights(tmp_path, {'targets': [
+        {'user_id': 2, 'read': True},
+        {'user_id': 3, 'read': True},
+        {'user_id': 99, 'read': True},
+        {'token': 'token-4', 'grant': True},
+        {'token': 'unknown', 'read': True},
+    ]})
+
+    assert status == 200
+    assert [(result['index'], result['user_id'], result['status'])
+            for result in payload['results']] == [
+        (0, 2, 'update-success'),
+        (1, 3, 'admin-can-not-be-target'),
+        (2, None, 'user-not-found'),
+        (3, 4, 'update-success'),
+        (4, None, 'invalid-token'),
+    ]
+    assert db.set_many == [(PROJECT_ID, [(2, True, False, False),
+                                         (4, False, False, True)])]
+
+
+def test_bulk_rights_can_not_exceed_own_rights(tmp_path):
+    status, payload, db = patch_rights(tmp_path, {'targets': [
+        {'user_id': 2, 'write': True},
+    ]})
+
+    assert status == 200
+    assert payload['results'][0]['status'] == 'not-enough-rights'
+    assert db.set_many == []
+
+
+def test_bulk_rights_last_entry_for_user_wins(tmp_path):
+    _, _, db = patch_rights(tmp_path, {'targets': [
+        {'user_id': 2, 'read': True},
+        {'user_id': 2, 'grant': True},
+    ]})
+
+    assert db.set_many == [(PROJECT_ID, [(2, False, False, True)])]
+
+
+class FlakyIdentity(FakeIdentity):
+    async def get_yandex_id(self, token):
+        if token == 'token-timeout':
+            raise TimeoutError()
+        return await super().get_yandex_id(token)
+
+
+def test_bulk_rights_identity_error_fails_only_its_target(tmp_path):
+    status, _, payload, app = call_app(
+        tmp_path, FakeDB, 'PATCH', '/project/lavka/rights',
+        identity=FlakyIdentity(TOKENS), json={'targets': [
+            {'token': 'token-timeout', 'read': True},
+            {'token': 'token-4', 'read': True},
+        ]})
+
+    assert status == 200
+    assert [(result['user_id'], result['status'])
+            for result in json.loads(payload)['results']] == [
+        (None, 'identity-error'),
+        (4, 'update-success'),
+    ]
+    assert app['pg_db_manager'].set_many == [
+        (PROJECT_ID, [(4, True, False, False)])]
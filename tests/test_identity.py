@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from security.api.identity import IdentityClient
+
+
+async def slow_info(request):
+    await asyncio.sleep(0.5)
+    return web.json_response({'id': 'y1'})
+
+
+def test_waiting_for_a_pool_slot_is_bounded():
+    async def run():
+        app = web.Application()
+        app.router.add_get('/info', slow_info)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        client = IdentityClient(base_url=f'http://127.0.0.1:{port}',
+                                limit=1, total_timeout=0.1)
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await asyncio.gather(
+                client.get_yandex_id('a'), client.get_yandex_id('b'),
+                return_exceptions=True)
+            elapsed = loop.time() - started
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+    # второй запрос ждёт единственное соединение пула не дольше total
+    assert all(isinstance(result, asyncio.TimeoutError)
+               for result in results)
+    assert elapsed == pytest.approx(0.1, abs=0.1)
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import FakeDBManager, call_app
+from security.api.logstats import analyze
+
+
+class FailingDB(FakeDBManager):
+    async def access_get(self, project_name, user_id=None, yandex_id=None):
+        raise RuntimeError('db is down')
+
+
+@pytest.mark.parametrize('breadcrumbs', [False, True])
+def test_requests_from_middleware_output(tmp_path, breadcrumbs):
+    # строки лога пишут настоящие middleware, а не подготовленный текст;
+    # пары строк проверяют и порядок rel_url и строки активации
+    call_app(tmp_path, FakeDBManager, 'GET', '/ping')
+    call_app(tmp_path, FailingDB, 'GET', '/project/lavka')
+    call_app(tmp_path, FakeDBManager, 'GET', '/ping')
+
+    report = analyze([str(tmp_path / 'api_logs.txt')],
+                     breadcrumbs=breadcrumbs)
+
+    assert {route: (row['count'], row['errors'])
+            for route, row in report['routes'].items()} == {
+        '/ping': (2, 0),
+        '/project/{project_name}': (1, 1),
+    }
+    assert report['unmatched'] == 0
+
+
+def test_trace_lines_do_not_depend_on_breadcrumb_order(tmp_path):
+    log = tmp_path / 'api_logs.txt'
+    log.write_text(
+        '2026-10-18 12:00:00,000 DEBUG Handler "PingView" has been '
+        'activated.\n'
+        "2026-10-18 12:00:00,001 DEBUG request.rel_url=URL('/ping')\n"
+        '2026-10-18 12:00:00,002 DEBUG Handler "PingView" is finish his '
+        'work.\n'
+        '2026-10-18 12:00:00,002 INFO {"request_id":"1","duration_ms":2.0,'
+        '"spans":[],"method":"GET","path":"/ping","route":"/ping",'
+        '"status":200,"user_id":null}\n')
+
+    assert list(analyze([str(log)])['routes']) == ['/ping']
+    # без трассировки строка активации до rel_url теряет маршрут
+    assert list(analyze([str(log)], breadcrumbs=True)['routes']) == \
+        ['unknown']
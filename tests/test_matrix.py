@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from conftest import Access, Change, FakeDBManager, FakeIdentity, \
+    PROJECT_ID, call_app
+from security.api.app import create_app, reset_on_rights_change
+from security.db.manager import DBManager
+from security.db.matrix import AccessMatrix, GRANT, LINKED, READ
+from security.db.rights import InvalidationListener, RightsCache
+
+
+class LoadedMatrixDB(FakeDBManager):
+    """Матрица загружена со старым правом передачи у пользователя 1,
+    а в БД оно уже отозвано."""
+
+    async def _rows(self, rows):
+        for row in rows:
+            yield row
+
+    def project_stream(self):
+        return self._rows([(PROJECT_ID, 'lavka')])
+
+    def access_stream(self):
+        return self._rows([(1, PROJECT_ID, True, True, True),
+                           (2, PROJECT_ID, True, False, False)])
+
+    async def access_get(self, project_name, user_id=None, yandex_id=None):
+        return Access(user_id, False, PROJECT_ID, project_name,
+                      True, False, False, 1, 2)
+
+
+def test_project_slice_requires_current_grant(tmp_path):
+    status, _, body, _ = call_app(tmp_path, LoadedMatrixDB, 'GET',
+                                  '/matrix?project=lavka')
+    assert status == 403
+    assert b'not-enough-rights' in body
+
+
+def test_own_slice_is_served_from_matrix(tmp_path):
+    status, _, body, _ = call_app(tmp_path, LoadedMatrixDB, 'GET',
+                                  '/matrix?user_id=1')
+    assert status == 200
+    assert body.count(b'\n') == 1
+
+
+def published(db: DBManager, changes, **message) -> dict:
+    """Уведомление, которое DBManager отправит после фиксации."""
+    payloads = []
+
+    async def execute(query, parameters=None):
+        payloads.append(parameters['payload'])
+
+    db.execute = execute
+    asyncio.run(db.publish_invalidation(changes, **message))
+    return json.loads(payloads[0])
+
+
+def test_matrix_follows_notifications(tmp_path):
+    app = create_app(log_file=str(tmp_path / 'api_logs.txt'))
+    handle = reset_on_rights_change(app)
+    db, matrix = app['pg_db_manager'], app['access_matrix']
+    matrix.loaded = True
+
+    handle(published(db, None, project_id=PROJECT_ID, project_name='lavka'))
+    handle(published(db, [Change(1, PROJECT_ID, True, False, True)],
+                     project_id=PROJECT_ID))
+    assert matrix.loaded
+    assert matrix.project_id('lavka') == PROJECT_ID
+    assert matrix.get_cell(1, PROJECT_ID) == LINKED | READ | GRANT
+
+    handle(published(db, None, project_id=PROJECT_ID, project_name='taxi'))
+    handle(published(db, [Change(1, PROJECT_ID, None, None, None)],
+                     user_ids=[1]))
+    assert matrix.project_id('taxi') == PROJECT_ID
+    assert matrix.get_cell(1, PROJECT_ID) == 0
+    assert matrix.loaded
+    app['log_manager'].stop()
+
+
+def test_oversized_changes_invalidate_matrix(tmp_path):
+    app = create_app(log_file=str(tmp_path / 'api_logs.txt'))
+    handle = reset_on_rights_change(app)
+    db, matrix = app['pg_db_manager'], app['access_matrix']
+    matrix.loaded = True
+
+    message = published(db, [Change(user_id, PROJECT_ID, True, True, True)
+                             for user_id in range(1000)],
+                        project_id=PROJECT_ID)
+    assert message['changes'] is None
+    handle(message)
+    assert not matrix.loaded
+    app['log_manager'].stop()
+
+
+def test_handlers_leave_matrix_to_notifications(tmp_path):
+    class UpsertDB(FakeDBManager):
+        async def access_get(self, project_name, user_id=None,
+                             yandex_id=None):
+            return Access(user_id, False, PROJECT_ID, project_name,
+                          True, False, True, 1, 1)
+
+        async def user_get_principal(self, yandex_id):
+            return 2, False
+
+        async def access_upsert(self, *args, **kwargs):
+            # до фиксации транзакции матрицу менять нельзя
+            return [Change(2, PROJECT_ID, True, False, True)]
+
+    status, _, _, app = call_app(
+        tmp_path, UpsertDB, 'PATCH', '/project/lavka?read=true',
+        identity=FakeIdentity({'token-2': 'y2'}),
+        json={'target_token': 'token-2'})
+    assert status == 200
+    assert app['access_matrix'].get_cell(2, PROJECT_ID) == 0
+
+
+def test_broken_notification_resets_matrix():
+    messages = []
+    listener = InvalidationListener('', 'rights', RightsCache(60, 10),
+                                    on_message=messages.append)
+    listener._notify(None, 1, 'rights', 'not json')
+    assert messages == [{'all': True}]
+
+
+def test_invalidation_during_load_keeps_matrix_stale():
+    matrix = AccessMatrix()
+
+    class DB:
+        async def _projects(self):
+            matrix.invalidate()
+            yield PROJECT_ID, 'lavka'
+
+        def project_stream(self):
+            return self._projects()
+
+        async def _accesses(self):
+            return
+            yield
+
+        def access_stream(self):
+            return self._accesses()
+
+    asyncio.run(matrix.load(DB()))
+    assert not matrix.loaded
@@ -0,0 +1,24 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from security.api.app import create_app, create_metrics_app
+
+
+def test_metrics_app_serves_only_metrics(tmp_path):
+    async def run():
+        app = create_app(log_file=str(tmp_path / 'api_logs.txt'))
+        try:
+            async with TestClient(TestServer(create_metrics_app(app))) \
+                    as client:
+                metrics = await client.get('/metrics')
+                ping = await client.get('/ping')
+                return metrics.status, await metrics.text(), ping.status
+        finally:
+            app['log_manager'].stop()
+
+    status, body, ping_status = asyncio.run(run())
+    # без токена: порт метрик не проходит авторизацию основного
+    assert status == 200
+    assert 'db_pool_connections{state="size"} 0' in body
+    assert ping_status == 404
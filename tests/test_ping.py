@@ -0,0 +1,38 @@
+from conftest import FakeDBManager, call_app
+
+
+class ColdDB(FakeDBManager):
+    """Пул не прогрелся при старте, Postgres при этом отвечает."""
+
+    def __init__(self, real):
+        super().__init__(real)
+        self.warm_ups = 0
+        self.reachable = False
+
+    async def ping(self):
+        pass
+
+    async def warm_up(self):
+        self.warm_ups += 1
+        if not self.reachable:
+            raise ConnectionRefusedError()
+        self.warm = True
+
+
+def test_ping_db_is_unavailable_until_warm(tmp_path):
+    status, _, body, app = call_app(tmp_path, ColdDB, 'GET', '/ping_db')
+    assert status == 503
+    assert b'db-is-unavailable' in body
+    assert not app['pg_db_manager'].warm
+
+
+def test_ping_db_retries_warm_up(tmp_path):
+    def factory(real):
+        db = ColdDB(real)
+        db.reachable = True
+        return db
+
+    status, _, body, app = call_app(tmp_path, factory, 'GET', '/ping_db')
+    assert status == 200
+    assert b'"warm":true' in body
+    assert app['pg_db_manager'].warm_ups == 1
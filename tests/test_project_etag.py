@@ -0,0 +1,48 @@
+from conftest import Access, FakeDBManager, PROJECT_ID, call_app
+from security.api.cache import Principal
+
+
+def fake_db(has_access: bool):
+    class FakeDB(FakeDBManager):
+        async def access_version(self, project_name, user_id):
+            return False, PROJECT_ID, 1, 3 if has_access else None
+
+        async def access_get(self, project_name, user_id=None,
+                             yandex_id=None):
+            rights = (True, False, True) if has_access else (None,) * 3
+            return Access(user_id, False, PROJECT_ID, project_name,
+                          *rights, 1, 3 if has_access else None)
+    return FakeDB
+
+
+def test_matching_etag_returns_not_modified(tmp_path):
+    status, headers, _, _ = call_app(tmp_path, fake_db(True), 'GET',
+                                     '/project/lavka')
+    assert status == 200
+
+    status, _, body, _ = call_app(
+        tmp_path, fake_db(True), 'GET', '/project/lavka',
+        headers={'If-None-Match': 'W/' + headers['ETag']})
+    assert status == 304
+    assert body == b''
+
+
+def test_etag_is_hidden_without_access(tmp_path):
+    for if_none_match in ('*', '"7.1.0.0"'):
+        status, headers, body, _ = call_app(
+            tmp_path, fake_db(False), 'GET', '/project/lavka',
+            headers={'If-None-Match': if_none_match})
+        assert status == 404
+        assert 'ETag' not in headers
+        assert b'project-not-found' in body
+
+
+def test_admin_without_link_gets_etag(tmp_path):
+    class AdminDB(fake_db(False)):
+        async def access_version(self, project_name, user_id):
+            return True, PROJECT_ID, 1, None
+
+    status, _, _, _ = call_app(tmp_path, AdminDB, 'GET', '/project/lavka',
+                               principal=Principal(1, True),
+                               headers={'If-None-Match': '*'})
+    assert status == 304
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from aiohttp import ClientPayloadError
+
+from conftest import FakeDBManager, call_app
+
+
+class FakeDB(FakeDBManager):
+    async def project_list(self, user_id, is_admin, after, limit):
+        rows = [(1, 'лавка "север"', True, False, True),
+                (2, 'p2', None, None, None)]
+        for row in rows[:limit]:
+            yield row
+
+
+def test_project_list_streams_valid_json(tmp_path):
+    status, headers, body, _ = call_app(tmp_path, FakeDB, 'GET',
+                                        '/project?limit=2')
+
+    assert status == 200
+    assert headers['Content-Type'].startswith('application/json')
+    assert json.loads(body) == {'projects': [
+        {'project_id': 1, 'name': 'лавка "север"',
+         'grant': True, 'write': False, 'read': True},
+        {'project_id': 2, 'name': 'p2',
+         'grant': True, 'write': True, 'read': True},
+    ], 'next': 2}
+
+
+def failing_db(rows_before_error: int):
+    class FailingDB(FakeDBManager):
+        async def project_list(self, user_id, is_admin, after, limit):
+            for project_id in range(1, rows_before_error + 1):
+                yield project_id, f'p{project_id}', True, True, True
+            raise TimeoutError()
+    return FailingDB
+
+
+def test_error_before_first_row_is_a_normal_error(tmp_path):
+    status, _, body, _ = call_app(tmp_path, failing_db(0), 'GET',
+                                  '/project')
+
+    assert status == 500
+    assert json.loads(body) == {'message': 'server-error'}
+
+
+def test_error_while_streaming_aborts_the_response(tmp_path):
+    with pytest.raises(ClientPayloadError):
+        call_app(tmp_path, failing_db(1), 'GET', '/project')
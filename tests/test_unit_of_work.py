@@ -0,0 +1,143 @@
+import asyncio
+
+from sqlalchemy import text
+
+from conftest import Access, FakeDBManager, FakeIdentity, PROJECT_ID, \
+    Target, call_app
+from security.db import queries
+from security.db.manager import UnitOfWork
+
+WRITE = text('UPDATE projects SET version = version + 1')
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.committed = False
+        self.rolled_back = False
+
+    async def execute(self, statement, parameters=None):
+        self.statements.append(statement)
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        self.rolled_back = True
+
+    async def close(self):
+        self.engine.open -= 1
+
+
+class FakeEngine:
+    def __init__(self):
+        self.connections = []
+        self.open = 0
+
+    async def connect(self):
+        self.open += 1
+        self.connections.append(FakeConnection(self))
+        return self.connections[-1]
+
+
+def test_request_uses_one_connection():
+    async def run():
+        engine = FakeEngine()
+        unit = UnitOfWork(engine)
+        await unit.execute(queries.PING_DB)
+        await unit.execute(WRITE)
+        await unit.execute(queries.PING_DB)
+        connection, = engine.connections
+        assert connection.statements == [queries.PING_DB, WRITE,
+                                         queries.PING_DB]
+
+        await unit.close(commit=True)
+        assert engine.open == 0
+        assert connection.committed
+
+    asyncio.run(run())
+
+
+class RecordingIdentity(FakeIdentity):
+    def __init__(self, events):
+        super().__init__({'token-2': 'y2'})
+        self.events = events
+
+    async def get_yandex_id(self, token):
+        self.events.append('identity')
+        return await super().get_yandex_id(token)
+
+
+def recording_db(events):
+    class RecordingDB(FakeDBManager):
+        async def access_get(self, project_name, user_id=None,
+                             yandex_id=None):
+            events.append('db')
+            return Access(user_id, False, PROJECT_ID, project_name,
+                          True, False, True, 1, 1)
+
+        async def user_get_principal(self, yandex_id):
+            events.append('db')
+            return 2, False
+
+        async def user_get_many(self, user_ids, yandex_ids):
+            events.append('db')
+            return [Target(2, 'y2', False)]
+
+        async def access_upsert(self, *args, **kwargs):
+            events.append('db')
+            return []
+
+        async def access_set_many(self, project_id, rights):
+            events.append('db')
+            return []
+    return RecordingDB
+
+
+def test_tokens_are_resolved_before_first_query(tmp_path):
+    requests = [
+        ('/project/lavka?read=true', {'target_token': 'token-2'}),
+        ('/project/lavka/rights',
+         {'targets': [{'token': 'token-2', 'read': True}]}),
+    ]
+    for path, body in requests:
+        events = []
+        status, _, _, _ = call_app(
+            tmp_path, recording_db(events), 'PATCH', path,
+            identity=RecordingIdentity(events), json=body)
+        assert status == 200
+        # соединение закрепляется первым запросом к БД
+        assert events[0] == 'identity' and 'identity' not in events[1:]
+
+
+class FailingDB(FakeDBManager):
+    """Запись прошла, а следующий шаг обработчика упал."""
+
+    async def access_get(self, project_name, user_id=None, yandex_id=None):
+        return Access(user_id, False, PROJECT_ID, project_name,
+                      True, False, True, 1, 1)
+
+    async def user_get_many(self, user_ids, yandex_ids):
+        return [Target(2, 'y2', False)]
+
+    async def access_set_many(self, project_id, rights):
+        await self.real.execute(WRITE)
+        raise RuntimeError('boom')
+
+
+def test_handler_error_rolls_back_writes(tmp_path):
+    engine = FakeEngine()
+
+    def factory(real):
+        real._engine = engine
+        return FailingDB(real)
+
+    status, _, _, _ = call_app(
+        tmp_path, factory, 'PATCH', '/project/lavka/rights',
+        json={'targets': [{'user_id': 2, 'read': True}]})
+
+    assert status == 500
+    connection, = engine.connections
+    assert connection.rolled_back and not connection.committed
+    assert engine.open == 0
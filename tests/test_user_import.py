@@ -0,0 +1,71 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from conftest import FakeDBManager, call_app
+from security.api.cache import Principal
+from security.db.importer import MAX_LINE_BYTES, split_lines
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def collect(*parts, max_line=8) -> list:
+    async def run():
+        return [line async for line in split_lines(chunks(*parts),
+                                                   max_line)]
+    return asyncio.run(run())
+
+
+def test_split_lines_joins_lines_across_chunks():
+    assert collect(b'{"a"', b':1}\n{"b":2}\n', b'{"c"', b':3}') == \
+        [b'{"a":1}\n', b'{"b":2}\n', b'{"c":3}']
+
+
+def test_split_lines_replaces_long_lines_with_none():
+    assert collect(b'short\n0123456', b'789abc\nok\n', b'0123456789') == \
+        [b'short\n', None, b'ok\n', None]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.copied = []
+
+    async def execute(self, query, *args):
+        return 'INSERT 0 1'
+
+    async def fetch(self, query):
+        return []
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copied.append((table, records))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class ImportDB(FakeDBManager):
+    @asynccontextmanager
+    async def raw_connection(self):
+        self.connection = FakeConnection()
+        yield self.connection
+
+
+def test_oversized_line_is_a_record_error(tmp_path):
+    body = b'{"yandex_id": "y1"}\n' + b'x' * (MAX_LINE_BYTES + 1) + \
+        b'\n{"yandex_id": "y3"}\n'
+    status, _, payload, app = call_app(
+        tmp_path, ImportDB, 'POST', '/user/import', data=body,
+        principal=Principal(1, True))
+
+    assert status == 200
+    records = [json.loads(line) for line in payload.splitlines()]
+    assert records[0] == {'line': 2, 'error': 'line-too-long'}
+    assert records[-1]['done']['errors'] == 1
+    users = [records for table, records
+             in app['pg_db_manager'].connection.copied
+             if table == 'import_users']
+    assert users == [[(1, 'y1', False), (3, 'y3', False)]]